@@ -1,14 +1,16 @@
-import time
-import requests
+import asyncio
+import threading
 import os
 import sys
 import json
 from pathlib import Path
 import platform
 import subprocess
-from core.books import ExcelManager
+from core.books import LedgerReader, parse_date
+from core.commands import FastPath
 from utils import server
-from PySide6.QtCore import Qt, QDir, Slot, QThread, QObject, Signal
+from utils.webhook import WebhookClient
+from PySide6.QtCore import Qt, QDir, Slot, QThread, QObject, Signal, QRunnable, QThreadPool
 from PySide6.QtGui import QFont, QFontDatabase
 from PySide6.QtWidgets import (
     QApplication,
@@ -28,6 +30,8 @@ from PySide6.QtWidgets import (
     QFormLayout,
     QProgressBar,
     QInputDialog,
+    QListWidget,
+    QListWidgetItem,
 )
 
 FUTURISTIC_FONT_FAMILY = "JetBrains Mono"
@@ -36,6 +40,10 @@ ACTIONS_SERVER_URL = "http://localhost:5055/"
 CORE_SERVER_HEALTH_URL = "http://localhost:5005/status"
 ACTIONS_SERVER_HEALTH_URL = "http://localhost:5055/health"
 CONFIG_FILE_PATH = (Path(__file__).parent / "config" / "config.json").resolve()
+# Receipt jobs run at once, the rest wait in the queue. Batches use every core on their own.
+RECEIPT_JOB_THREADS = 2
+# Seconds to wait for the stack before showing the error page
+SERVER_READY_TIMEOUT = 300
 
 # Styles
 COLORS = {
@@ -64,30 +72,72 @@ COLORS = {
 
 class ServerCheckWorker(QObject):
     finished = Signal(bool)
+    status = Signal(str, str)  # service name, state
 
     @Slot()
     def run(self):
         """
-        Polls server health endpoints for up to 60 seconds
-        before giving up.
+        Starts the stack, or attaches to one already running, then
+        probes every service at once until the whole stack is ready,
+        reporting each service's state as it changes.
         """
-        start_time = time.time()
-        timeout_seconds = 300
+        try:
+            print(server.start_server())
+            report = asyncio.run(server.wait_until_ready(SERVER_READY_TIMEOUT, on_status=self.status.emit))
+        except Exception as e:
+            print(f"Server check failed with exception: {e}")
+            self.finished.emit(False)
+            return
+        print(report)
+        self.finished.emit(report.ready)
 
-        while time.time() - start_time < timeout_seconds:
-            try:
-                if server.check_servers_sync():
-                    self.finished.emit(True)
-                    return
-            except Exception as e:
-                # This handles cases where the server is not even listening yet
-                print(f"Server check failed with exception: {e}")
 
-            print("Servers not ready yet, retrying in 2 seconds...")
-            time.sleep(2) # Wait for 2 seconds before retrying
+class WebhookSignals(QObject):
+    """
+    Carries WebhookClient callbacks from its worker thread to the main thread.
+    """
+    message = Signal(int, str)  # prompt ID, text
+    failed = Signal(int, str)  # prompt ID, error
+    done = Signal(int)  # prompt ID
+
+
+class ReceiptJobSignals(QObject):
+    progress = Signal(int, int, int)  # job ID, done, total (0 if unknown)
+    finished = Signal(int, object)  # job ID, result
+    failed = Signal(int, str)  # job ID, error
+
+
+class ReceiptJob(QRunnable):
+    """
+    Receipt work run on a QThreadPool thread, so the window stays responsive.
+    work is called with a progress callback taking (done, total) and a
+    threading.Event that is set when the job is cancelled. Its result, or
+    error, arrives on the main thread through signals.
+    """
+
+    def __init__(self, job_id, work):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.job_id = job_id
+        self.work = work
+        self.cancelled = threading.Event()
+        self.signals = ReceiptJobSignals()
+
+    def cancel(self):
+        self.cancelled.set()
 
-        print("Server check timed out after 60 seconds.")
-        self.finished.emit(False)
+    @Slot()
+    def run(self):
+        if self.cancelled.is_set():
+            self.signals.finished.emit(self.job_id, None)
+            return
+        try:
+            result = self.work(lambda done, total: self.signals.progress.emit(self.job_id, done, total),
+                               self.cancelled)
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, str(e))
+        else:
+            self.signals.finished.emit(self.job_id, result)
 
 
 class AccountingAssistantUI(QMainWindow):
@@ -99,6 +149,22 @@ class AccountingAssistantUI(QMainWindow):
         self.file_abs_path = None
         self.current_theme = "light"
         self.selected_signature_path = ""
+        # Receipt jobs by ID, with their list item, description and result handler
+        self.receipt_pool = QThreadPool(self)
+        self.receipt_pool.setMaxThreadCount(RECEIPT_JOB_THREADS)
+        self.receipt_jobs = {}
+        self.next_receipt_job_id = 1
+        # Templated prompts are run locally instead of through Rasa
+        self.fast_path = FastPath()
+        # Other prompts queue for the bot without blocking the window
+        self.webhook_signals = WebhookSignals()
+        self.webhook_signals.message.connect(self.on_bot_message)
+        self.webhook_signals.failed.connect(self.on_bot_request_failed)
+        self.webhook_signals.done.connect(self.on_bot_request_done)
+        self.webhook = WebhookClient(CORE_SERVER_URL, sender="user1",
+                                     on_message=self.webhook_signals.message.emit,
+                                     on_error=lambda prompt_id, e: self.webhook_signals.failed.emit(prompt_id, str(e)),
+                                     on_done=self.webhook_signals.done.emit)
         # self.apply_global_styles()
 
         self.setup_theme_system()
@@ -136,8 +202,7 @@ class AccountingAssistantUI(QMainWindow):
         self.server_check_thread.quit()
         self.server_check_thread.wait()
     def initialize_system(self):
-        # Boot up servers
-        server.start_server()
+        # The loading page boots up the servers
         with open(CONFIG_FILE_PATH, "r") as f:
             config = json.load(f)
             if config['user']['firstTime']:
@@ -236,6 +301,14 @@ class AccountingAssistantUI(QMainWindow):
 
         layout.addWidget(label)
         layout.addWidget(progress)
+
+        # One line per service, updated as each becomes ready
+        self.service_status_labels = {}
+        for service_name in server.SERVICES:
+            service_label = QLabel()
+            service_label.setAlignment(Qt.AlignCenter)
+            self.service_status_labels[service_name] = service_label
+            layout.addWidget(service_label)
         layout.addStretch()
         self.stacked_widget.addWidget(self.loading_page)
 
@@ -248,9 +321,16 @@ class AccountingAssistantUI(QMainWindow):
 
         self.server_check_thread.started.connect(self.worker.run)
         self.worker.finished.connect(self.on_server_check_finished)
+        self.worker.status.connect(self.on_service_status)
+        for service_name in self.service_status_labels:
+            self.on_service_status(service_name, server.WAITING)
 
         self.server_check_thread.start()
 
+    @Slot(str, str)
+    def on_service_status(self, service_name, state):
+        self.service_status_labels[service_name].setText(f"{service_name}: {state}")
+
     def create_error_page(self):
         self.error_page = QWidget()
         layout = QVBoxLayout(self.error_page)
@@ -368,6 +448,21 @@ class AccountingAssistantUI(QMainWindow):
 
         main_layout.addWidget(receipts_group)
 
+        jobs_group = QGroupBox("")
+        jobs_layout = QHBoxLayout(jobs_group)
+        jobs_layout.setSpacing(15)
+
+        self.receipt_jobs_list = QListWidget()
+        self.receipt_jobs_list.setMaximumHeight(90)
+
+        self.cancel_receipt_job_button = QPushButton("Cancel Job")
+        self.cancel_receipt_job_button.clicked.connect(self.on_cancel_receipt_job_button_clicked)
+
+        jobs_layout.addWidget(self.receipt_jobs_list)
+        jobs_layout.addWidget(self.cancel_receipt_job_button, alignment=Qt.AlignTop)
+
+        main_layout.addWidget(jobs_group)
+
         back_button = QPushButton("Back")
         back_button.clicked.connect(self.go_to_file_selection_page)
 
@@ -412,35 +507,43 @@ class AccountingAssistantUI(QMainWindow):
     def submit_AI_request(self) -> None:
         prompt = self.prompt_input.text().strip()
         if prompt:
+            self.output_text.append(f"User: {prompt}")
+            # Templated prompts are run on the worksheet, in their turn, on the webhook's thread
+            file_abs_path = self.file_abs_path
+            handle_locally = (lambda: self.fast_path.handle(prompt, file_abs_path)) \
+                if file_abs_path is not None else None
             # Append file path to request
-            prompt += f" EXCEL_FILE_PATH/app/sheet_data/{self.file_path}"
-            # Attempt to get hold of server
-            try:
-                response = requests.post(url=CORE_SERVER_URL,
-                                         json={"sender": "user1",
-                                               "message": prompt})
-                # Check if response was accepted
-                if response.status_code == requests.codes.ok:
-                    self.output_text.append(f"User: {prompt}")
-                    messages = response.json()
-                    for msg in messages:
-                        if 'text' in msg:
-                            self.output_text.append(f"Calcite: {msg['text']}")
-            # Give warnings incase of exception
-            except Exception as e:
-                QMessageBox.warning(self, "Error", "The server was unable to accept your request, no changes made")
-            finally:
-                # Prepare for next message
-                self.prompt_input.clear()
+            self.webhook.submit(f"{prompt} EXCEL_FILE_PATH/app/sheet_data/{self.file_path}",
+                                handle_locally=handle_locally)
+            self.statusBar().showMessage(f"Waiting for Calcite ({self.webhook.pending()} pending)")
+            # Prepare for next message
+            self.prompt_input.clear()
+
+    @Slot(int, str)
+    def on_bot_message(self, prompt_id, text):
+        self.output_text.append(f"Calcite: {text}")
+
+    @Slot(int, str)
+    def on_bot_request_failed(self, prompt_id, error):
+        self.output_text.append(f"Calcite: Unable to run your request, no changes made ({error})")
+
+    @Slot(int)
+    def on_bot_request_done(self, prompt_id):
+        pending = self.webhook.pending()
+        if pending:
+            self.statusBar().showMessage(f"Waiting for Calcite ({pending} pending)")
+        else:
+            self.statusBar().showMessage(str(self.fast_path), 10000)
 
     def on_generate_receipt_button_clicked(self):
-        receipt_client = ExcelManager(self.file_abs_path)
+        receipt_client = LedgerReader(self.file_abs_path)
         
         choice, ok = QInputDialog.getItem(
             self, 
             "Receipt Generation", 
             "Choose receipt type:",
-            ["Latest Transaction", "Specific Transaction ID"], 
+            ["Latest Transaction", "Specific Transaction ID", "Batch (Date Range, Currency or IDs)",
+             "PDF Statement (Date Range, Currency or IDs)"], 
             0, 
             False
         )
@@ -453,21 +556,174 @@ class AccountingAssistantUI(QMainWindow):
             return
             
         if choice == "Latest Transaction":
-            receipt_name = receipt_client.generate_receipt(received_by=received_by)
-            if receipt_name:
-                QMessageBox.information(self, "Receipt Generated", f"Receipt for latest transaction added at {receipt_name}")
-            else:
-                QMessageBox.warning(self, "No Transaction", "No transactions found to generate receipt from.")
-        else:
+            self.submit_receipt_job(
+                "Latest transaction",
+                lambda progress, cancelled: receipt_client.generate_receipt(received_by=received_by),
+                self.on_latest_receipt_finished)
+        elif choice == "Specific Transaction ID":
             reference_id, confirmed = QInputDialog.getText(self, "Transaction ID", "Enter the transaction reference ID:")
             if confirmed and reference_id.strip():
-                receipt_name = receipt_client.generate_receipt_by_id(received_by=received_by, reference_id=reference_id.strip())
-                if receipt_name and receipt_name != "No such transaction was found, no receipt generated":
-                    QMessageBox.information(self, "Receipt Generated", f"Receipt for transaction {reference_id} added at {receipt_name}")
-                else:
-                    QMessageBox.warning(self, "Transaction Not Found", f"No transaction found with reference ID: {reference_id}")
+                reference_id = reference_id.strip()
+                self.submit_receipt_job(
+                    f"Transaction {reference_id}",
+                    lambda progress, cancelled: receipt_client.generate_receipt_by_id(received_by=received_by,
+                                                                                      reference_id=reference_id),
+                    lambda receipt_name: self.on_receipt_by_id_finished(reference_id, receipt_name))
             else:
                 QMessageBox.warning(self, "Input Required", "Please enter a valid transaction reference ID.")
+        elif choice.startswith("Batch"):
+            self.generate_batch_receipts(receipt_client, received_by)
+        else:
+            self.export_pdf_statement(receipt_client, received_by)
+
+    def on_latest_receipt_finished(self, receipt_name):
+        if receipt_name:
+            QMessageBox.information(self, "Receipt Generated", f"Receipt for latest transaction added at {receipt_name}")
+            return receipt_name
+        QMessageBox.warning(self, "No Transaction", "No transactions found to generate receipt from.")
+        return "no transactions"
+
+    def on_receipt_by_id_finished(self, reference_id, receipt_name):
+        if receipt_name and receipt_name != "No such transaction was found, no receipt generated":
+            QMessageBox.information(self, "Receipt Generated", f"Receipt for transaction {reference_id} added at {receipt_name}")
+            return receipt_name
+        QMessageBox.warning(self, "Transaction Not Found", f"No transaction found with reference ID: {reference_id}")
+        return "not found"
+
+    def ask_receipt_filters(self, title):
+        """
+        Asks for the reference IDs, or else the date range and currency, of a batch.
+        Returns the keyword arguments for LedgerReader, or None if cancelled.
+        """
+        reference_ids, confirmed = QInputDialog.getText(
+            self, "Transaction IDs",
+            "Enter reference IDs separated by commas, or leave empty to filter by date and currency:")
+        if not confirmed:
+            return None
+        reference_ids = [reference_id.strip() for reference_id in reference_ids.split(",") if reference_id.strip()]
+        if reference_ids:
+            return {"reference_ids": reference_ids}
+        filters = {}
+        for key, label in (("start", "First date to include (e.g. 2024-10-01), or leave empty:"),
+                           ("end", "Last date to include (e.g. 2024-10-31), or leave empty:"),
+                           ("currency", "Currency code (e.g. USD), or leave empty:")):
+            value, confirmed = QInputDialog.getText(self, title, label)
+            if not confirmed:
+                return None
+            if not value.strip():
+                continue
+            if key != "currency" and parse_date(value.strip()) is None:
+                QMessageBox.warning(self, "Invalid Date", f"{value.strip()} is not a recognisable date.")
+                return None
+            filters[key] = value.strip()
+        return filters
+
+    def generate_batch_receipts(self, receipt_client, received_by):
+        filters = self.ask_receipt_filters("Batch Receipts")
+        if filters is None:
+            return
+        self.submit_receipt_job(
+            "Batch receipts",
+            lambda progress, cancelled: receipt_client.generate_receipts(received_by=received_by, progress=progress,
+                                                                         cancelled=cancelled, **filters),
+            self.on_batch_receipts_finished)
+
+    def on_batch_receipts_finished(self, report):
+        if not report.generated and not report.failed:
+            return "no transactions matched"
+        message = str(report)
+        if report.missing:
+            message += f", no transaction found for: {', '.join(report.missing)}"
+        return message
+
+    def export_pdf_statement(self, receipt_client, received_by):
+        filters = self.ask_receipt_filters("PDF Statement")
+        if filters is None:
+            return
+        output_path, _ = QFileDialog.getSaveFileName(
+            self, "Save Statement", str((Path(__file__).parent / "receipts" / "statement.pdf").resolve()),
+            "PDF Files (*.pdf)")
+        if not output_path:
+            return
+        self.submit_receipt_job(
+            f"Statement {Path(output_path).name}",
+            lambda progress, cancelled: receipt_client.export_statement(
+                output_path, received_by=received_by, progress=lambda pages: progress(pages, 0),
+                cancelled=cancelled, **filters),
+            lambda summary: self.on_statement_finished(output_path, summary))
+
+    def on_statement_finished(self, output_path, summary):
+        if not summary.receipts:
+            return "no transactions matched, the statement has no receipts"
+        return f"{summary.receipts} receipts saved at {output_path}"
+
+    def submit_receipt_job(self, description, work, on_finished):
+        """
+        Queues receipt work on the receipt thread pool and lists it under the receipt buttons.
+        on_finished is called on the main thread with the work's result and returns
+        the text shown for the finished job.
+        """
+        job_id = self.next_receipt_job_id
+        self.next_receipt_job_id += 1
+        job = ReceiptJob(job_id, work)
+        job.signals.progress.connect(self.on_receipt_job_progress)
+        job.signals.finished.connect(self.on_receipt_job_finished)
+        job.signals.failed.connect(self.on_receipt_job_failed)
+
+        item = QListWidgetItem(f"{description}: queued")
+        item.setData(Qt.UserRole, job_id)
+        self.receipt_jobs_list.insertItem(0, item)
+        self.receipt_jobs[job_id] = (job, item, description, on_finished)
+        self.receipt_pool.start(job)
+
+    @Slot(int, int, int)
+    def on_receipt_job_progress(self, job_id, done, total):
+        if job_id not in self.receipt_jobs:
+            return
+        _, item, description, _ = self.receipt_jobs[job_id]
+        item.setText(f"{description}: {done} of {total}" if total else f"{description}: {done} done")
+
+    @Slot(int, object)
+    def on_receipt_job_finished(self, job_id, result):
+        job, item, description, on_finished = self.receipt_jobs.pop(job_id)
+        if job.cancelled.is_set() and (result is None or getattr(result, "cancelled", False)):
+            text = "cancelled"
+        else:
+            text = on_finished(result)
+        item.setText(f"{description}: {text}")
+        self.statusBar().showMessage(f"{description}: {text}", 10000)
+
+    @Slot(int, str)
+    def on_receipt_job_failed(self, job_id, error):
+        _, item, description, _ = self.receipt_jobs.pop(job_id)
+        item.setText(f"{description}: failed")
+        QMessageBox.warning(self, "Error", f"{description} failed: {error}")
+
+    def on_cancel_receipt_job_button_clicked(self):
+        item = self.receipt_jobs_list.currentItem()
+        job_id = item.data(Qt.UserRole) if item is not None else None
+        if job_id not in self.receipt_jobs:
+            self.statusBar().showMessage("Select a queued or running receipt job to cancel", 5000)
+            return
+        job, item, description, _ = self.receipt_jobs[job_id]
+        job.cancel()
+        # A queued job is taken off the pool at once, a running one stops at its next receipt
+        if self.receipt_pool.tryTake(job):
+            self.receipt_jobs.pop(job_id)
+            item.setText(f"{description}: cancelled")
+        else:
+            item.setText(f"{description}: cancelling...")
+
+    def closeEvent(self, event):
+        # Running jobs stop at their next receipt rather than finishing their whole batch
+        for job, _, _, _ in self.receipt_jobs.values():
+            job.cancel()
+        self.receipt_pool.clear()
+        self.receipt_pool.waitForDone()
+        self.webhook.close(wait=False)
+        if not server.keep_alive():
+            server.stop_server()
+        super().closeEvent(event)
 
     def on_past_receipts_button_clicked(self):
         receipts_path = (Path(__file__).parent / "receipts").resolve()
@@ -0,0 +1,232 @@
+"""
+Benchmarks for core.books and core.receipt on synthetic ledgers.
+
+Usage:
+    python -m benchmarks.bench_books --sizes 1000 10000 --output results.json
+    python -m benchmarks.bench_books --compare before.json after.json
+
+Each ledger size runs in a fresh process, so that peak RSS reflects that size alone.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import queue
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import openpyxl
+from openpyxl import Workbook
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core import receipt  # noqa: E402
+from core.books import ExcelManager  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+CURRENCIES = ["USD", "AED", "EUR", "GBP"]
+RECEIVED_BY = "benchmark"
+# Seconds between checks that a benchmark process is still alive
+RESULT_POLL_SECONDS = 5
+
+
+def generate_workbook(path: Path, rows: int) -> None:
+    """
+    Writes a synthetic ledger with openpyxl's streaming writer.
+    :param path: Where to save the workbook
+    :param rows: Number of transactions
+    :return: None
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(['Amount', 'Currency', 'Conversion Rate', 'Transaction Date', 'Reference ID'])
+    for i in range(rows):
+        ws.append([round(10 + (i * 7919) % 100_000 / 100, 2), CURRENCIES[i % len(CURRENCIES)],
+                   3.67, f"{1 + i % 28:02d}/{1 + i % 12:02d}/2024", str(i)])
+    wb.save(path)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def summarise(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))]
+
+    return {
+        "runs": len(ordered),
+        "mean_s": statistics.fmean(ordered),
+        "p50_s": percentile(50),
+        "p95_s": percentile(95),
+        "p99_s": percentile(99),
+        "max_s": ordered[-1],
+    }
+
+
+def measure(operation: Callable[[int], None], repeat: int) -> Dict[str, float]:
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - start)
+    return summarise(samples)
+
+
+def run_size(path: str, rows: int, repeat: int, results) -> None:
+    """
+    Benchmarks every operation against one ledger. Runs in a child process.
+    Receipts and their cache index are written next to the ledger, so the
+    user's receipts folder is left alone.
+    """
+    receipt.RECEIPTS_DIR = Path(path).parent / "receipts"
+    receipt.receipt_cache = receipt.ReceiptCache(receipt.RECEIPTS_DIR)
+    manager: Optional[ExcelManager] = None
+
+    def load(_):
+        nonlocal manager
+        manager = ExcelManager(path)
+
+    def add(i):
+        manager.add_transaction(amount=42.0, currency="USD", conversion_rate=3.67,
+                                transaction_date="05/10/2024", reference_id=f"bench-{i}")
+
+    def delete(i):
+        # Rows from the middle of the ledger, so every row below has to move up
+        manager.delete_transaction(reference_id=str(rows // 2 + i))
+
+    def receipt_by_id(i):
+        manager.generate_receipt_by_id(received_by=RECEIVED_BY, reference_id=str(rows - 1 - i))
+
+    def render(i):
+        receipt.generate_receipt(received_by=RECEIVED_BY, reference_id=f"render-{i}",
+                                 transaction_date="05/10/2024", amount=42.0, currency="USD", use_cache=False)
+
+    operations = {"load": load, "add_transaction": add, "delete_transaction": delete,
+                  "generate_receipt_by_id": receipt_by_id, "receipt.generate_receipt": render}
+    image = receipt.render_receipt(received_by=RECEIVED_BY, reference_id="encode", transaction_date="05/10/2024",
+                                   amount=42.0, currency="USD")
+    receipt_bytes = {}
+    for preset, encoder in receipt.ENCODER_PRESETS.items():
+        operations[f"receipt.encode[{preset}]"] = lambda _, encoder=encoder: encoder.encode(image)
+        receipt_bytes[preset] = encoder.encode(image).size
+    timings = {name: measure(operation, repeat) for name, operation in operations.items()}
+    results.put({"operations": timings, "receipt_bytes": receipt_bytes, "peak_rss_bytes": peak_rss_bytes()})
+
+
+def wait_for_result(process, results) -> Dict:
+    """
+    Waits for a benchmark process's result, giving up if the process dies
+    without one, e.g. when the OS kills it for running out of memory.
+    :return: The result, or one holding an error and no operations
+    """
+    while True:
+        try:
+            return results.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            if process.is_alive():
+                continue
+        # A result put just before exiting may still be in flight
+        try:
+            return results.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            process.join()
+            return {"error": f"benchmark process exited with code {process.exitcode} before reporting",
+                    "operations": {}}
+
+
+def run(sizes: List[int], repeat: int, cache_dir: Path) -> Dict:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "openpyxl": openpyxl.__version__,
+            "repeat": repeat,
+        },
+        "sizes": {},
+    }
+    context = multiprocessing.get_context("spawn")
+    for rows in sizes:
+        source = cache_dir / f"ledger-{rows}.xlsx"
+        if not source.exists():
+            print(f"Generating {rows} row ledger...")
+            generate_workbook(source, rows)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / source.name
+            shutil.copy(source, path)
+            results = context.Queue()
+            process = context.Process(target=run_size, args=(str(path), rows, repeat, results))
+            process.start()
+            result = wait_for_result(process, results)
+            process.join()
+        result["file_size_bytes"] = source.stat().st_size
+        report["sizes"][str(rows)] = result
+        if "error" in result:
+            print(f"{rows} rows: {result['error']}")
+            continue
+        print(f"{rows} rows: " + ", ".join(f"{name} p50 {timing['p50_s'] * 1000:.1f}ms"
+                                           for name, timing in result["operations"].items()))
+    return report
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """
+    Prints the p50 latency change of every operation between two result files.
+    """
+    with open(before_path) as f:
+        before = json.load(f)["sizes"]
+    with open(after_path) as f:
+        after = json.load(f)["sizes"]
+    print(f"{'rows':>9}  {'operation':<30}{'before':>12}{'after':>12}{'change':>9}")
+    for rows in sorted(set(before) & set(after), key=int):
+        for name, timing in after[rows]["operations"].items():
+            if name not in before[rows]["operations"]:
+                continue
+            old, new = before[rows]["operations"][name]["p50_s"], timing["p50_s"]
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"{rows:>9}  {name:<30}{old * 1000:>10.1f}ms{new * 1000:>10.1f}ms{change:>+8.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark core.books and core.receipt")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Ledger sizes in rows")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per operation")
+    parser.add_argument("--cache-dir", type=Path, default=Path(tempfile.gettempdir()) / "calcite-bench",
+                        help="Where generated ledgers are kept between runs")
+    parser.add_argument("--output", default=f"bench-{datetime.now():%Y%m%d-%H%M%S}.json",
+                        help="Where to write the JSON results")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="Compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = run(args.sizes, args.repeat, args.cache_dir)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
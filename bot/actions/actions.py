@@ -1,6 +1,7 @@
 from rasa_sdk import Action, Tracker
 from typing import Any, Dict
-from core import books
+from core.pool import workbook_writer
+from core.transaction import Transaction
 
 
 class AddTransaction(Action):
@@ -32,9 +33,9 @@ class AddTransaction(Action):
             text=f"Adding transaction amount: {amount} {currency}, conversion rate: {conversion_rate}, "
                  f"reference ID: {reference_id}, time: {time}"
         )
-        current_workbook = books.ExcelManager(file_path)
-        current_workbook.add_transaction(amount=amount, currency=currency, conversion_rate=conversion_rate,
-                                         reference_id=reference_id, transaction_date=time)
+        transaction = Transaction(amount=amount, currency=currency, conversion_rate=conversion_rate,
+                                  transaction_date=time, reference_id=reference_id)
+        await workbook_writer.submit(file_path, lambda workbook: workbook.add(transaction))
         dispatcher.utter_message(text="Transaction added successfully.")
         return []
 
@@ -57,6 +58,6 @@ class DeleteTransaction(Action):
         if not file_path or not reference_id:
             dispatcher.utter_message(text="File path or reference ID is missing. Please try again.")
             return []
-        current_workbook = books.ExcelManager(file_path)
-        current_workbook.delete_transaction(reference_id=reference_id)
+        await workbook_writer.submit(file_path, lambda workbook: workbook.delete_transaction(
+            reference_id=reference_id))
         return []
@@ -1,5 +1,190 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from openpyxl import load_workbook
+from openpyxl.packaging.custom import IntProperty, StringProperty
 from core import receipt
+from core.package import save_worksheet, workbook_fingerprint
+from core.transaction import FIELDS, Transaction, parse_date
+
+FIRST_ROW_NUMBER = 2
+NUMBER_OF_COLS = 5
+REFERENCE_ID_COLUMN = 5
+JOURNAL_SUFFIX = ".journal"
+# Custom document property recording the last journal entry folded into the workbook
+JOURNAL_SEQ_PROPERTY = "CalciteJournalSeq"
+# Custom document property listing the rows tombstoned by delete_transaction(), e.g. "3,5-9"
+TOMBSTONES_PROPERTY = "CalciteTombstones"
+# Rows handed to the journal at once during bulk imports
+IMPORT_CHUNK_SIZE = 1000
+# Rejection messages kept in an ImportReport
+MAX_REPORTED_ERRORS = 100
+
+# Managers holding batched writes that have not been saved yet, kept alive
+# until they are saved so that dropping one cannot lose its writes. Journal
+# writes are not held here: the journal is durable and replayed on load.
+_PENDING_MANAGERS: Set["ExcelManager"] = set()
+
+
+def file_signature(filepath) -> Tuple[int, int]:
+    """
+    Returns a cheap fingerprint of a file on disk.
+    :param filepath:
+    :return: (modification time in nanoseconds, size in bytes)
+    """
+    stat = os.stat(filepath)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def reference_key(reference_id: Any) -> Optional[str]:
+    """
+    Normalises a reference ID for lookups, so that 2431 typed as a number in
+    Excel and "2431 " read from an import find each other.
+    :param reference_id:
+    :return: Reference ID as stripped text, or None
+    """
+    return str(reference_id).strip() if reference_id is not None else None
+
+
+def format_rows(rows: Iterable[int]) -> str:
+    """
+    Writes row numbers as comma separated runs, e.g. "3,5-9".
+    :param rows:
+    :return: Text for TOMBSTONES_PROPERTY
+    """
+    runs = []
+    for row in sorted(rows):
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in runs)
+
+
+def parse_rows(text: Optional[str]) -> Set[int]:
+    """
+    Reads row numbers written by format_rows().
+    :param text:
+    :return: Set of row numbers
+    """
+    rows = set()
+    for run in (text or "").split(","):
+        first, _, last = run.strip().partition("-")
+        if first:
+            rows.update(range(int(first), int(last or first) + 1))
+    return rows
+
+
+def validate_transaction(transaction: Any) -> Transaction:
+    """
+    Validates a transaction and normalises its values.
+    :param transaction: Transaction, mapping keyed by FIELDS or a sequence of five values
+    :return: Transaction
+    :raises ValueError: If the transaction is malformed
+    """
+    if isinstance(transaction, Mapping):
+        missing = [name for name in FIELDS if transaction.get(name) in (None, "")]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        values = [transaction[name] for name in FIELDS]
+    elif isinstance(transaction, (list, tuple)) and len(transaction) == len(FIELDS):
+        values = list(transaction)
+    else:
+        raise ValueError(f"expected a mapping or a sequence of {len(FIELDS)} values")
+
+    amount, currency, conversion_rate, transaction_date, reference_id = values
+    try:
+        amount = float(amount)
+        conversion_rate = float(conversion_rate)
+    except (TypeError, ValueError):
+        raise ValueError(f"amount and conversion rate must be numbers, got {amount!r} and {conversion_rate!r}")
+    currency = str(currency).strip() if currency is not None else ""
+    reference_id = reference_key(reference_id) or ""
+    if not currency or not reference_id or transaction_date in (None, ""):
+        raise ValueError("currency, transaction date and reference ID are required")
+    if isinstance(transaction_date, str):
+        transaction_date = transaction_date.strip()
+    return Transaction(amount, currency, conversion_rate, transaction_date, reference_id)
+
+
+@dataclass
+class ImportReport:
+    """
+    Outcome of a bulk import.
+    Attributes:
+        added (int): Rows written to the workbook
+        rejected (int): Rows that failed validation
+        duplicates (list): Reference IDs already present in the workbook or the import
+        errors (list): Reasons for the first rejected rows
+        seconds (float): Time spent importing
+    """
+    added: int = 0
+    rejected: int = 0
+    duplicates: List[Any] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.added / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (f"Imported {self.added} transactions in {self.seconds:.2f}s "
+                f"({self.rows_per_second:.0f} rows/s), {self.rejected} rejected, "
+                f"{len(self.duplicates)} duplicate reference IDs")
+
+
+@atexit.register
+def _flush_pending_managers() -> None:
+    """
+    Saves outstanding batched writes when the interpreter exits cleanly.
+    Managers whose file changed on disk since they loaded it, e.g. ones a
+    WorkbookPool replaced, are skipped rather than saved over the newer file.
+    :return: None
+    """
+    for manager in list(_PENDING_MANAGERS):
+        if manager.is_stale():
+            print(f"Warning: Dropping pending writes to {manager.filepath}, which was changed on disk")
+            _PENDING_MANAGERS.discard(manager)
+            continue
+        try:
+            manager.flush()
+        except OSError as e:
+            # One workbook that cannot be saved, e.g. moved away, must not cost the others their writes
+            print(f"Warning: Could not save pending writes to {manager.filepath}: {e}")
+            _PENDING_MANAGERS.discard(manager)
+
+
+class LedgerObserver:
+    """
+    Base class for objects kept in step with an ExcelManager's worksheet.
+    Register with ExcelManager.add_observer(); every hook is a no-op by default.
+    Methods:
+        on_add(manager, row_number, transaction): A transaction was appended at row_number.
+        on_delete(manager, row_number, shifted): The transaction at row_number was deleted,
+        and the rows below moved up by one if shifted, or it was tombstoned otherwise.
+        on_reset(manager): Rows were renumbered wholesale, e.g. by a reload or compaction.
+        on_commit(manager): Writes were made durable, by a save or a journal append.
+    """
+
+    def on_add(self, manager: "ExcelManager", row_number: int, transaction: Transaction) -> None:
+        pass
+
+    def on_delete(self, manager: "ExcelManager", row_number: int, shifted: bool) -> None:
+        pass
+
+    def on_reset(self, manager: "ExcelManager") -> None:
+        pass
+
+    def on_commit(self, manager: "ExcelManager") -> None:
+        pass
 
 
 class ExcelManager:
@@ -7,38 +192,264 @@ class ExcelManager:
     A class representing an Excel workbook.
     Attributes:
         filepath (str): Path to the Excel workbook
+        sidecar (SqliteIndex): SQLite copy of the ledger, if kept
     Methods:
         load(): Creates a new Excel workbook if it doesn't exist else loads it.
         add_transaction(
         amount, currency, conversion_rate, transaction_date, reference_id
         ): Adds a transaction to the Excel workbook.
         delete_transaction(): Deletes a transaction from the Excel workbook.
+        add(transaction): Adds a Transaction to the Excel workbook.
+        add_transactions(transactions): Adds many transactions with a single save.
+        find_by_reference(reference_id): Returns a transaction by its reference ID.
+        latest(): Returns the last transaction in the workbook.
+        batch(flush_every): Context manager deferring saves until the block exits.
+        flush(): Saves any writes deferred by batch() or held in the journal.
+        start_compactor(interval): Folds the journal into the workbook in the background.
+        compact(): Physically removes rows tombstoned by delete_transaction().
+        iter_rows(): Yields the row number and values of every live transaction.
+        add_observer(observer): Keeps a LedgerObserver in step with the worksheet.
+        write_headers(): Writes the header row if it differs from the expected headers.
     """
 
-    def __init__(self, filepath: str) -> None:
+    def __init__(self, filepath: str, journal: bool = False, tombstone_deletes: bool = False,
+                 differential_save: bool = False, lazy: bool = False, sidecar: bool = False) -> None:
         """
         Initializes the Excel workbook, with a given filepath.
         :param filepath (str): Path to the Excel workbook:
+        :param journal (bool): Record writes in a sidecar journal instead of saving
+        the workbook on every write
+        :param tombstone_deletes (bool): Hide deleted rows instead of removing them,
+        leaving the removal to compact(). The rows are listed in the workbook's
+        TOMBSTONES_PROPERTY, so rows hidden by hand in Excel are never taken as deleted.
+        :param differential_save (bool): Regenerate only the ledger worksheet's part of
+        the xlsx on save when possible, copying every other part as it is
+        :param lazy (bool): Defer loading the workbook until it is first used
+        :param sidecar (bool): Keep a SqliteIndex of the ledger in <workbook>.sqlite. Lookups
+        and duplicate checks are answered from it until the workbook is loaded, so a lazy
+        manager finds transactions without parsing the xlsx, and it serves range queries
         """
         super().__init__()
         self.filepath = filepath
+        self.journal = journal
+        self.tombstone_deletes = tombstone_deletes
+        self.differential_save = differential_save
+        self._wb = None
+        self._ws = None
+        # Row numbers of transactions deleted but not yet compacted away
+        self._tombstones: Set[int] = set()
+        self.journal_path = f"{os.fspath(filepath)}{JOURNAL_SUFFIX}"
+        # Sequence number of the last journal entry applied to the worksheet
+        self.journal_seq = 0
+        self._lock = threading.RLock()
+        self._compactor: Optional[threading.Thread] = None
+        self._stop_compactor = threading.Event()
         self.headers = ['Amount', 'Currency',
                         'Conversion Rate', 'Transaction Date',
                         'Reference ID']
+        # Maps each reference ID, as given by reference_key(), to the (ascending) row numbers holding it
+        self._reference_index: Dict[str, List[int]] = {}
+        # Writes made since the last save, and nesting depth of batch() blocks
+        self.pending_writes = 0
+        self._batch_depth = 0
+        self._flush_every: Optional[int] = None
+        # Fingerprint of the file as last loaded or saved by this manager
+        self.disk_signature: Optional[Tuple[int, int]] = None
+        # workbook_fingerprint() of the workbook as last loaded or saved, for differential saves
+        self._package_fingerprint: Optional[int] = None
+        self.observers: List[LedgerObserver] = []
+
+        self.sidecar = None
+
+        if lazy:
+            self.disk_signature = file_signature(self.filepath)
+        else:
+            self.load()
+        if sidecar:
+            # Imported here as the sidecar module builds on this one
+            from core.sidecar import SqliteIndex
+            self.sidecar = SqliteIndex(self.filepath, self)
+
+    @property
+    def wb(self):
+        if self._wb is None:
+            self.load()
+        return self._wb
 
-        self.load()
+    @property
+    def ws(self):
+        if self._ws is None:
+            self.load()
+        return self._ws
+
+    @property
+    def reference_index(self) -> Dict[str, List[int]]:
+        if self._wb is None:
+            self.load()
+        return self._reference_index
+
+    @reference_index.setter
+    def reference_index(self, value: Dict[str, List[int]]) -> None:
+        self._reference_index = value
+
+    @property
+    def tombstones(self) -> Set[int]:
+        if self._wb is None:
+            self.load()
+        return self._tombstones
+
+    @tombstones.setter
+    def tombstones(self, value: Set[int]) -> None:
+        self._tombstones = value
+
+    @property
+    def loaded(self) -> bool:
+        return self._wb is not None
 
     def load(self) -> None:
         """
-        Loads a given Excel workbook
+        Loads a given Excel workbook.
+        The header row is written, and the workbook saved, only if it differs
+        from the expected headers, so opening a workbook leaves it untouched.
         :return: None
         """
-        self.wb = load_workbook(self.filepath)
-        self.ws = self.wb.active
+        with self._lock:
+            self._wb = load_workbook(self.filepath)
+            self._ws = self._wb.active
+            self.disk_signature = file_signature(self.filepath)
+            if self.differential_save:
+                self._package_fingerprint = workbook_fingerprint(self._wb, self._ws)
+            # Writes not saved before a reload are lost with the old worksheet
+            self.pending_writes = 0
+            _PENDING_MANAGERS.discard(self)
+            headers_changed = self.write_headers()
+            self._load_rows()
+            if headers_changed:
+                self.save()
+
+    def write_headers(self) -> bool:
+        """
+        Writes the header cells that differ from the expected headers.
+        :return: True if any header cell was written
+        """
+        changed = False
         for col_num, header in enumerate(self.headers, start=1):
-            self.ws.cell(row=1, column=col_num, value=header)
+            cell = self.ws.cell(row=1, column=col_num)
+            if cell.value != header:
+                cell.value = header
+                changed = True
+        return changed
+
+    def _load_rows(self) -> None:
+        """
+        Indexes the loaded worksheet and applies the journal on top of it.
+        :return: None
+        """
+        # Tombstones are honoured whatever this manager's mode, as they are deletes
+        props = self.wb.custom_doc_props
+        self.tombstones = parse_rows(props[TOMBSTONES_PROPERTY].value) \
+            if TOMBSTONES_PROPERTY in props.names else set()
+        self.build_index()
+        if self.journal:
+            self.replay_journal()
+        self._notify('on_reset')
+
+    def add_observer(self, observer: LedgerObserver) -> None:
+        self.observers.append(observer)
+
+    def remove_observer(self, observer: LedgerObserver) -> None:
+        self.observers.remove(observer)
+
+    def _notify(self, event: str, *args) -> None:
+        for observer in self.observers:
+            getattr(observer, event)(self, *args)
+
+    def iter_rows(self) -> Iterator[Tuple[int, Transaction]]:
+        """
+        Yields every transaction that is not tombstoned.
+        :return: Iterator of (row number, Transaction)
+        """
+        for row_number, values in enumerate(
+                self.ws.iter_rows(min_row=FIRST_ROW_NUMBER, max_col=NUMBER_OF_COLS, values_only=True),
+                start=FIRST_ROW_NUMBER):
+            if row_number not in self.tombstones and any(value is not None for value in values):
+                yield row_number, Transaction._make(values)
+
+    def replay_journal(self) -> None:
+        """
+        Applies journal entries that have not been folded into the workbook yet.
+        :return: None
+        """
+        names = self.wb.custom_doc_props.names
+        self.journal_seq = self.wb.custom_doc_props[JOURNAL_SEQ_PROPERTY].value \
+            if JOURNAL_SEQ_PROPERTY in names else 0
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r") as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line left behind by a crash mid-append
+                    break
+                if record["seq"] <= self.journal_seq:
+                    continue
+                if record["op"] == "add":
+                    self._apply_add(Transaction.from_row(record["row"]))
+                elif record["op"] == "delete":
+                    self._apply_delete(record["reference_id"])
+                elif record["op"] == "compact":
+                    self._apply_compact()
+                self.journal_seq = record["seq"]
+                self.pending_writes += 1
+
+    def build_index(self) -> None:
+        """
+        Builds the reference ID index with a single pass over the worksheet.
+        :return: None
+        """
+        self.reference_index = {}
+        for row_number, values in enumerate(
+                self.ws.iter_rows(min_row=FIRST_ROW_NUMBER,
+                                  min_col=REFERENCE_ID_COLUMN,
+                                  max_col=REFERENCE_ID_COLUMN,
+                                  values_only=True),
+                start=FIRST_ROW_NUMBER):
+            if values[0] is not None and row_number not in self.tombstones:
+                self.reference_index.setdefault(reference_key(values[0]), []).append(row_number)
+
+    def find_row(self, reference_id: Any) -> Optional[int]:
+        """
+        Returns the row number of the first transaction with a given reference ID.
+        :param reference_id:
+        :return: Row number or None if no such transaction exists
+        """
+        if self.sidecar is not None and not self.loaded:
+            return self.sidecar.find_row(reference_id)
+        rows = self.reference_index.get(reference_key(reference_id))
+        return rows[0] if rows else None
 
-        self.save()
+    def find_by_reference(self, reference_id: Any) -> Optional[Transaction]:
+        """
+        Looks up a transaction by its reference ID in constant time.
+        :param reference_id:
+        :return: Transaction or None if no such transaction exists
+        """
+        if self.sidecar is not None and not self.loaded:
+            return self.sidecar.find_by_reference(reference_id)
+        row_number = self.find_row(reference_id)
+        if row_number is None:
+            return None
+        return self.transaction_at(row_number)
+
+    def transaction_at(self, row_number: int) -> Transaction:
+        """
+        Reads the transaction stored in a given row.
+        :param row_number: 1 based row number
+        :return: Transaction
+        """
+        return Transaction._make(next(self.ws.iter_rows(min_row=row_number, max_row=row_number,
+                                                        max_col=NUMBER_OF_COLS, values_only=True)))
 
     def add_transaction(self, amount: float, currency: str, conversion_rate: float,
                         transaction_date: str, reference_id: str) -> None:
@@ -51,59 +462,457 @@ class ExcelManager:
         :param reference_id:
         :return: None
         """
-        row = [
-            amount,
-            currency,
-            conversion_rate,
-            transaction_date,
-            reference_id
-        ]
-
-        self.ws.append(row)
-        self.save()
-
-    def delete_transaction(self, reference_id: str) -> bool:
-        first_row_number = 2
-        number_of_cols = 5
-        reference_id_column = 4
-        for row in self.ws.iter_rows(
-                min_row=first_row_number,
-                max_col=number_of_cols):
-            # Get transaction ID
-            if row[reference_id_column].value == reference_id:
-                self.ws.delete_rows(row[0].row)
-                self.save()
-                return True
-        return False
+        self.add(Transaction(amount, currency, conversion_rate, transaction_date, reference_id))
 
-    def generate_receipt_by_id(self, received_by, reference_id):
-        first_row_number = 2
-        number_of_cols = 5
-        reference_id_column = 4
-        for row in self.ws.iter_rows(min_row=first_row_number,
-                                     max_col=number_of_cols):
-            if row[reference_id_column].value == reference_id:
-                row_number = row[0].row  # Get the actual row number
-                amount = self.ws.cell(row=row_number, column=1).value
-                currency = self.ws.cell(row=row_number, column=2).value
-                transaction_date = self.ws.cell(row=row_number, column=4).value
-                reference_id = self.ws.cell(row=row_number, column=5).value
-                receipt_name = receipt.generate_receipt(received_by=str(received_by), reference_id=str(reference_id), amount=amount, currency=str(currency),
-                                                        transaction_date=str(transaction_date))
-                return receipt_name
-        return "No such transaction was found, no receipt generated"
+    def add(self, transaction: Transaction) -> None:
+        """
+        Adds a transaction to the last row of Excel workbook.
+        :param transaction:
+        :return: None
+        """
+        with self._lock:
+            self._apply_add(transaction)
+            self._commit({"op": "add", "row": transaction.to_row()})
 
-    def generate_receipt(self, received_by):
+    def _apply_add(self, transaction: Transaction) -> None:
+        self.ws.append(transaction)
+        if transaction.reference_id is not None:
+            self.reference_index.setdefault(reference_key(transaction.reference_id), []).append(self.ws.max_row)
+        self._notify('on_add', self.ws.max_row, transaction)
+
+    def add_transactions(self, transactions: Iterable[Any], skip_duplicates: bool = True) -> ImportReport:
+        """
+        Validates and appends many transactions in one pass, saving once at the end.
+        The iterable is consumed lazily, so generators of any length can be imported.
+        :param transactions: Transactions, mappings keyed by FIELDS or sequences of five values
+        :param skip_duplicates: Leave out transactions whose reference ID already exists
+        :return: ImportReport
+        """
+        report = ImportReport()
+        start = time.perf_counter()
+        with self._lock, self.batch():
+            records = []
+            for number, transaction in enumerate(transactions, start=1):
+                try:
+                    transaction = validate_transaction(transaction)
+                except ValueError as e:
+                    report.rejected += 1
+                    if len(report.errors) < MAX_REPORTED_ERRORS:
+                        report.errors.append(f"Transaction {number}: {e}")
+                    continue
+                if self.find_row(transaction.reference_id) is not None:
+                    report.duplicates.append(transaction.reference_id)
+                    if skip_duplicates:
+                        continue
+                self._apply_add(transaction)
+                report.added += 1
+                records.append({"op": "add", "row": transaction.to_row()})
+                if len(records) == IMPORT_CHUNK_SIZE:
+                    self._commit(*records)
+                    records = []
+            if records:
+                self._commit(*records)
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def delete_transaction(self, reference_id: Any) -> bool:
+        """
+        Deletes the first transaction with a given reference ID.
+        :param reference_id: Reference ID, or the Transaction to delete
+        :return: True if a transaction was deleted
+        """
+        if isinstance(reference_id, Transaction):
+            reference_id = reference_id.reference_id
+        with self._lock:
+            if not self._apply_delete(reference_id):
+                return False
+            self._commit({"op": "delete", "reference_id": reference_id})
+            return True
+
+    def _apply_delete(self, reference_id: Any) -> bool:
+        row_number = self.find_row(reference_id)
+        if row_number is None:
+            return False
+        if self.tombstone_deletes:
+            self.ws.row_dimensions[row_number].hidden = True
+            self.tombstones.add(row_number)
+            self._remove_from_index(reference_id, row_number, shift=False)
+            self._notify('on_delete', row_number, False)
+            return True
+        self._remove_rows({row_number})
+        self._remove_from_index(reference_id, row_number)
+        self._notify('on_delete', row_number, True)
+        return True
+
+    def compact(self) -> int:
+        """
+        Physically removes every tombstoned row in a single pass and saves once.
+        :return: Number of rows removed
+        """
+        with self._lock:
+            removed = len(self.tombstones)
+            if removed:
+                self._apply_compact()
+                self._commit({"op": "compact"})
+            return removed
+
+    def _apply_compact(self) -> None:
+        """
+        Removes the tombstoned rows with one sweep over every cell of the worksheet,
+        so compacting costs the same however many rows were tombstoned.
+        :return: None
+        """
+        tombstones = self.tombstones
+        self.tombstones = set()
+        self._remove_rows(tombstones)
+        self.build_index()
+        self._notify('on_reset')
+
+    def _remove_rows(self, rows: Set[int]) -> None:
+        """
+        Removes rows with a single sweep over the worksheet's cells and row dimensions,
+        moving every column of the rows below up by the number of rows removed above them.
+        Tombstones below a removed row move with their rows.
+        :param rows: Row numbers to remove
+        :return: None
+        """
+        removed = sorted(rows)
+        ws = self.ws
+        cells = {}
+        for (row, column), cell in ws._cells.items():
+            if row in rows:
+                continue
+            cell.row = row - bisect_left(removed, row)
+            cells[cell.row, column] = cell
+        ws._cells = cells
+        dimensions = [(row, dimension) for row, dimension in ws.row_dimensions.items() if row not in rows]
+        ws.row_dimensions.clear()
+        for row, dimension in dimensions:
+            dimension.index = row - bisect_left(removed, row)
+            ws.row_dimensions[dimension.index] = dimension
+        self.tombstones = {row - bisect_left(removed, row) for row in self.tombstones if row not in rows}
+
+    def _remove_from_index(self, reference_id: Any, row_number: int, shift: bool = True) -> None:
+        """
+        Drops a deleted row from the index and shifts the rows below it up by one.
+        :param reference_id:
+        :param row_number:
+        :param shift: Whether the rows below were physically moved up
+        :return: None
+        """
+        key = reference_key(reference_id)
+        rows = self.reference_index[key]
+        rows.remove(row_number)
+        if not rows:
+            del self.reference_index[key]
+        if not shift:
+            return
+        for rows in self.reference_index.values():
+            for i, row in enumerate(rows):
+                if row > row_number:
+                    rows[i] = row - 1
+
+    def latest(self) -> Optional[Transaction]:
         last_row = self.ws.max_row  # 1 based index of latest transaction
+        while last_row in self.tombstones:
+            last_row -= 1
         if last_row <= 1:
+            return None
+        return self.transaction_at(last_row)
+
+    def generate_receipt_by_id(self, received_by, reference_id):
+        transaction = self.find_by_reference(reference_id)
+        if transaction is None:
+            return "No such transaction was found, no receipt generated"
+        return receipt.generate_receipt_for(transaction, received_by=received_by)
+
+    def generate_receipt(self, received_by):
+        transaction = self.latest()
+        if transaction is None:
+            return
+        return receipt.generate_receipt_for(transaction, received_by=received_by)
+
+    @contextmanager
+    def batch(self, flush_every: Optional[int] = None) -> Iterator["ExcelManager"]:
+        """
+        Groups writes so that they are committed with a single save.
+        Writes are saved when the outermost batch exits, every flush_every
+        writes if given, on flush() or when the interpreter exits.
+        :param flush_every: Number of writes after which to save early
+        :return: The manager itself
+        """
+        self._batch_depth += 1
+        if flush_every is not None:
+            self._flush_every = flush_every
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._flush_every = None
+                self.flush()
+
+    def _commit(self, *records: dict) -> None:
+        """
+        Saves writes immediately, defers them while inside a batch,
+        or appends them to the journal when journaling.
+        :param records: Description of each write, as stored in the journal
+        :return: None
+        """
+        self.pending_writes += len(records)
+        if self.journal:
+            journal_records = []
+            for record in records:
+                self.journal_seq += 1
+                journal_records.append(dict(record, seq=self.journal_seq))
+            self._append_to_journal(journal_records)
+            self._notify('on_commit')
+            return
+        if self._batch_depth and not (self._flush_every and self.pending_writes >= self._flush_every):
+            _PENDING_MANAGERS.add(self)
+            return
+        self.flush()
+
+    def _append_to_journal(self, records: List[dict]) -> None:
+        """
+        Durably appends records to the journal.
+        :param records:
+        :return: None
+        """
+        with open(self.journal_path, "a") as journal_file:
+            journal_file.writelines(json.dumps(record, default=str) + "\n" for record in records)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def flush(self) -> None:
+        """
+        Saves deferred writes, if there are any.
+        When journaling this folds the journal into the workbook.
+        :return: None
+        """
+        with self._lock:
+            if self.pending_writes:
+                self.save()
+
+    def start_compactor(self, interval: float = 30.0) -> None:
+        """
+        Starts a background thread folding the journal into the workbook every interval seconds.
+        :param interval: Seconds between compactions
+        :return: None
+        """
+        if self._compactor is not None:
+            return
+        self._stop_compactor.clear()
+
+        def compact_periodically():
+            while not self._stop_compactor.wait(interval):
+                self.flush()
+
+        self._compactor = threading.Thread(target=compact_periodically, daemon=True)
+        self._compactor.start()
+
+    def stop_compactor(self) -> None:
+        """
+        Stops the background compactor and folds what is left of the journal.
+        :return: None
+        """
+        if self._compactor is None:
             return
-        amount = self.ws.cell(row=last_row, column=1).value
-        currency = self.ws.cell(row=last_row, column=2).value
-        transaction_date = self.ws.cell(row=last_row, column=4).value
-        reference_id = self.ws.cell(row=last_row, column=5).value
-        receipt_name = receipt.generate_receipt(received_by=str(received_by), reference_id=str(reference_id), amount=amount, currency=str(currency),
-                                                transaction_date=str(transaction_date))
-        return receipt_name
+        self._stop_compactor.set()
+        self._compactor.join()
+        self._compactor = None
+        self.flush()
+
+    def is_stale(self) -> bool:
+        """
+        Checks whether the file was changed on disk by someone else.
+        :return: True if the file differs from what this manager last loaded or saved
+        """
+        try:
+            return file_signature(self.filepath) != self.disk_signature
+        except FileNotFoundError:
+            return True
 
     def save(self) -> None:
-        self.wb.save(self.filepath)
+        with self._lock:
+            props = self.wb.custom_doc_props
+            if self.journal:
+                # Record how much of the journal the saved workbook contains, so that
+                # a crash before the journal is truncated cannot replay entries twice
+                if JOURNAL_SEQ_PROPERTY in props.names:
+                    del props[JOURNAL_SEQ_PROPERTY]
+                props.append(IntProperty(name=JOURNAL_SEQ_PROPERTY, value=self.journal_seq))
+            if TOMBSTONES_PROPERTY in props.names:
+                del props[TOMBSTONES_PROPERTY]
+            if self.tombstones:
+                props.append(StringProperty(name=TOMBSTONES_PROPERTY, value=format_rows(self.tombstones)))
+            temp_path = f"{os.fspath(self.filepath)}.tmp"
+            if not (self.differential_save and
+                    save_worksheet(self.wb, self.ws, self.filepath, temp_path, self._package_fingerprint)):
+                self.wb.save(temp_path)
+            os.replace(temp_path, self.filepath)
+            if self.differential_save:
+                self._package_fingerprint = workbook_fingerprint(self.wb, self.ws)
+            if self.journal and os.path.exists(self.journal_path):
+                os.truncate(self.journal_path, 0)
+            self.disk_signature = file_signature(self.filepath)
+            self.pending_writes = 0
+            _PENDING_MANAGERS.discard(self)
+            self._notify('on_commit')
+
+
+class LedgerReader:
+    """
+    A read-only, streaming view of an Excel workbook.
+    Rows are parsed lazily with openpyxl's read-only mode, so memory use stays
+    constant however large the ledger is, and the workbook is never saved.
+    Rows tombstoned by an ExcelManager with tombstone_deletes, as listed in the
+    workbook's TOMBSTONES_PROPERTY, are skipped unless asked otherwise. Rows
+    hidden by hand in Excel are always read.
+    Attributes:
+        filepath (str): Path to the Excel workbook
+        skip_tombstones (bool): Skip tombstoned rows
+    Methods:
+        iter_transactions(currency, start, end, reference_id): Yields matching transactions.
+        find_by_reference(reference_id): Returns the first transaction with a reference ID.
+        latest(): Returns the last transaction in the workbook.
+        generate_receipt(received_by): Generates a receipt for the last transaction.
+        generate_receipt_by_id(received_by, reference_id): Generates a receipt by reference ID.
+        generate_receipts(received_by, ...): Generates receipts for every matching transaction.
+        export_statement(output_path, received_by, ...): Writes matching transactions to a PDF statement.
+    """
+
+    def __init__(self, filepath: str, skip_tombstones: bool = True) -> None:
+        """
+        Initializes the reader, with a given filepath. Nothing is read until first use.
+        :param filepath (str): Path to the Excel workbook
+        :param skip_tombstones (bool): Skip rows deleted by an ExcelManager with
+        tombstone_deletes that were not compacted yet
+        """
+        self.filepath = filepath
+        self.skip_tombstones = skip_tombstones
+
+    def _iter_rows(self) -> Iterator[tuple]:
+        """
+        Streams the transaction rows of the active worksheet.
+        :return: Iterator of Transaction
+        """
+        wb = load_workbook(self.filepath, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            tombstones = set()
+            if self.skip_tombstones and TOMBSTONES_PROPERTY in wb.custom_doc_props.names:
+                tombstones = parse_rows(wb.custom_doc_props[TOMBSTONES_PROPERTY].value)
+            for row_number, values in enumerate(
+                    ws.iter_rows(min_row=FIRST_ROW_NUMBER, max_col=NUMBER_OF_COLS, values_only=True),
+                    start=FIRST_ROW_NUMBER):
+                if row_number not in tombstones and any(value is not None for value in values):
+                    yield Transaction.from_row(values)
+        finally:
+            wb.close()
+
+    def iter_transactions(self, currency: Optional[str] = None, start: Any = None, end: Any = None,
+                          reference_id: Any = None) -> Iterator[Transaction]:
+        """
+        Lazily yields the transactions matching every given filter.
+        :param currency: Currency code, case insensitive
+        :param start: First transaction date to include, as a date or text
+        :param end: Last transaction date to include, as a date or text
+        :param reference_id: Reference ID to match, as normalised by reference_key()
+        :return: Iterator of Transaction
+        """
+        currency = currency.upper() if currency else None
+        start = parse_date(start) if start is not None else None
+        end = parse_date(end) if end is not None else None
+        key = reference_key(reference_id)
+        for transaction in self._iter_rows():
+            if key is not None and reference_key(transaction.reference_id) != key:
+                continue
+            if currency and str(transaction.currency).upper() != currency:
+                continue
+            if start or end:
+                transaction_date = parse_date(transaction.transaction_date)
+                if transaction_date is None:
+                    continue
+                if (start and transaction_date < start) or (end and transaction_date > end):
+                    continue
+            yield transaction
+
+    def find_by_reference(self, reference_id: Any) -> Optional[Transaction]:
+        return next(self.iter_transactions(reference_id=reference_id), None)
+
+    def latest(self) -> Optional[Transaction]:
+        transaction = None
+        for transaction in self.iter_transactions():
+            pass
+        return transaction
+
+    def generate_receipt(self, received_by):
+        transaction = self.latest()
+        if transaction is None:
+            return
+        return receipt.generate_receipt_for(transaction, received_by=received_by)
+
+    def generate_receipt_by_id(self, received_by, reference_id):
+        transaction = self.find_by_reference(reference_id)
+        if transaction is None:
+            return "No such transaction was found, no receipt generated"
+        return receipt.generate_receipt_for(transaction, received_by=received_by)
+
+    def _matching(self, currency: Optional[str], start: Any, end: Any,
+                  reference_ids: Optional[Iterable[Any]]) -> Iterator[Transaction]:
+        wanted = None
+        if reference_ids is not None:
+            wanted = {reference_key(reference_id) for reference_id in reference_ids}
+        for transaction in self.iter_transactions(currency=currency, start=start, end=end):
+            if wanted is None or reference_key(transaction.reference_id) in wanted:
+                yield transaction
+
+    def generate_receipts(self, received_by, currency: Optional[str] = None, start: Any = None, end: Any = None,
+                          reference_ids: Optional[Iterable[Any]] = None, max_workers: Optional[int] = None,
+                          progress=None, cancelled: Optional[threading.Event] = None) -> "receipt.BatchReport":
+        """
+        Generates receipts for every transaction matching the given filters in one pass
+        over the workbook, rendering them in parallel.
+        :param received_by: Name of the person receiving the receipts
+        :param currency: Currency code, case insensitive
+        :param start: First transaction date to include, as a date or text
+        :param end: Last transaction date to include, as a date or text
+        :param reference_ids: Reference IDs to include, compared as text
+        :param max_workers: Number of rendering processes, defaults to the number of cores
+        :param progress: Called with (receipts done, total) while rendering
+        :param cancelled: Stops the batch once set
+        :return: BatchReport
+        """
+        if reference_ids is not None:
+            reference_ids = list(reference_ids)
+        transactions = list(self._matching(currency, start, end, reference_ids))
+        report = receipt.generate_receipts(transactions, received_by=str(received_by),
+                                           max_workers=max_workers, progress=progress, cancelled=cancelled)
+        if reference_ids is not None:
+            found = {str(transaction.reference_id) for transaction in transactions}
+            report.missing = sorted({str(reference_id) for reference_id in reference_ids} - found)
+        return report
+
+    def export_statement(self, output_path, received_by, currency: Optional[str] = None, start: Any = None,
+                         end: Any = None, reference_ids: Optional[Iterable[Any]] = None, summary: bool = True,
+                         progress=None, cancelled: Optional[threading.Event] = None) -> "receipt.StatementSummary":
+        """
+        Writes a PDF statement with a receipt page for every matching transaction,
+        streaming from the workbook to the PDF one page at a time.
+        :param output_path: Where to write the PDF
+        :param received_by: Name of the person receiving the statement
+        :param currency: Currency code, case insensitive
+        :param start: First transaction date to include, as a date or text
+        :param end: Last transaction date to include, as a date or text
+        :param reference_ids: Reference IDs to include, compared as text
+        :param summary: Start the statement with a summary page
+        :param progress: Called with the number of pages written so far
+        :param cancelled: Stops the export once set, leaving no file behind
+        :return: StatementSummary
+        """
+        if reference_ids is not None:
+            reference_ids = list(reference_ids)
+        return receipt.export_statement(self._matching(currency, start, end, reference_ids), output_path,
+                                        received_by=str(received_by), summary=summary, progress=progress,
+                                        cancelled=cancelled)
@@ -0,0 +1,248 @@
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+from core import receipt
+from core.books import ExcelManager
+from core.pool import WorkbookPool
+from core.transaction import Transaction
+
+ADD, DELETE, RECEIPT = "add", "delete", "receipt"
+
+# The word a command has to start with, after an optional "please"
+VERBS = (
+    (ADD, re.compile(r"^(?:please\s+)?(?:add|record|log)\b", re.IGNORECASE)),
+    (DELETE, re.compile(r"^(?:please\s+)?(?:delete|remove)\b", re.IGNORECASE)),
+    (RECEIPT, re.compile(r"^(?:please\s+)?(?:generate|create|make|issue|print)\b", re.IGNORECASE)),
+)
+REFERENCE = re.compile(r"\breference(?:\s+id)?\s*(?:number|no\.?|#|:)?\s*(?P<value>[^\s,;]+?)[.,;]?(?=\s|$)",
+                       re.IGNORECASE)
+RATE = re.compile(r"\b(?:conversion\s+)?rate\s*(?:of|is|=|:)?\s*(?P<value>\d+(?:\.\d+)?)\b", re.IGNORECASE)
+DATE = re.compile(r"\b(?P<value>today|yesterday|tomorrow|\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/\d{4})\b",
+                  re.IGNORECASE)
+LATEST = re.compile(r"\b(?:latest|last|most\s+recent)\b", re.IGNORECASE)
+# A name in capitals closing the prompt, e.g. "... received by John Doe"
+RECEIVED_BY = re.compile(r"\b(?:received\s+by|to|for)\s+(?P<value>[A-Z][\w.'-]*(?:\s+[A-Z][\w.'-]*)*)\s*[.!]?\s*$")
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP"}
+RELATIVE_DAYS = {"today": 0, "yesterday": -1, "tomorrow": 1}
+# Words allowed around the recognised parts of a command; any other word
+# makes the prompt ambiguous and leaves it to Rasa
+FILLER = frozenset("""
+please can could you i want would like to a an the new my this that transaction transactions entry
+of for on at with and by dated date id number amount money receipt receipts generate create make issue print
+add record log delete remove
+""".split())
+# Three letter words that are never a currency code
+_NOT_CURRENCY = "|".join(sorted(word for word in FILLER if len(word) == 3))
+AMOUNT = re.compile(r"(?:(?P<symbol>[$€£])\s*(?P<symbol_amount>\d[\d,]*(?:\.\d+)?)"
+                    rf"|\b(?P<amount>\d[\d,]*(?:\.\d+)?)\s*(?!(?:{_NOT_CURRENCY})\b)(?P<currency>[A-Za-z]{{3}})\b"
+                    rf"|\b(?!(?:{_NOT_CURRENCY})\b)(?P<prefix_currency>[A-Za-z]{{3}})\s*(?P<prefix_amount>\d[\d,]*(?:\.\d+)?))",
+                    re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class Command:
+    """
+    A prompt understood by the local grammar.
+    Attributes:
+        action (str): "add", "delete" or "receipt"
+        reference_id (str): Reference ID acted on, None for a receipt of the latest transaction
+        transaction (Transaction): Transaction to add
+        received_by (str): Name the receipt is made out to, if given in the prompt
+    """
+    action: str
+    reference_id: Optional[str] = None
+    transaction: Optional[Transaction] = None
+    received_by: Optional[str] = None
+
+
+def _take(pattern, text: str):
+    """
+    Finds exactly one match of a clause and removes it from the text.
+    :return: (match or None, remaining text), with None for a clause given more than once
+    """
+    matches = list(pattern.finditer(text))
+    if len(matches) != 1:
+        return None, text
+    match = matches[0]
+    return match, f"{text[:match.start()]} {text[match.end():]}"
+
+
+def _only_filler(text: str) -> bool:
+    return all(word in FILLER for word in re.findall(r"[^\s,;.!?:]+", text.lower()))
+
+
+def _reference(value: str) -> str:
+    # Normalised as the action server does with the reference_id slot
+    return value.strip().lower()
+
+
+def _timestamp(value: str, today: date) -> Optional[str]:
+    """
+    Converts a date to the ISO timestamp Duckling would give the action server.
+    Dates such as 05/10/2024, read differently by day-first and month-first
+    conventions, are not converted.
+    :return: e.g. "2024-10-21T00:00:00.000-07:00", or None
+    """
+    value = value.lower()
+    try:
+        if value in RELATIVE_DAYS:
+            day = today + timedelta(days=RELATIVE_DAYS[value])
+        elif "-" in value:
+            day = datetime.strptime(value, "%Y-%m-%d").date()
+        else:
+            first, second, year = map(int, value.split("/"))
+            if first <= 12 and second <= 12 and first != second:
+                return None
+            month, day_of_month = (first, second) if first <= 12 else (second, first)
+            day = date(year, month, day_of_month)
+    except ValueError:
+        return None
+    return datetime.combine(day, time()).astimezone().isoformat(timespec="milliseconds")
+
+
+def _amount(match) -> tuple:
+    if match.group("symbol"):
+        amount, currency = match.group("symbol_amount"), CURRENCY_SYMBOLS[match.group("symbol")]
+    elif match.group("currency"):
+        amount, currency = match.group("amount"), match.group("currency")
+    else:
+        amount, currency = match.group("prefix_amount"), match.group("prefix_currency")
+    return float(amount.replace(",", "")), currency.upper()
+
+
+def _parse_add(text: str, today: date) -> Optional[Command]:
+    reference, text = _take(REFERENCE, text)
+    rate, text = _take(RATE, text)
+    when, text = _take(DATE, text)
+    amount, text = _take(AMOUNT, text)
+    if not (reference and rate and when and amount) or not _only_filler(text):
+        return None
+    transaction_date = _timestamp(when.group("value"), today)
+    if transaction_date is None:
+        return None
+    amount, currency = _amount(amount)
+    reference_id = _reference(reference.group("value"))
+    return Command(ADD, reference_id, Transaction(amount=amount, currency=currency,
+                                                  conversion_rate=float(rate.group("value")),
+                                                  transaction_date=transaction_date,
+                                                  reference_id=reference_id))
+
+
+def _parse_delete(text: str) -> Optional[Command]:
+    reference, text = _take(REFERENCE, text)
+    if not reference or not _only_filler(text):
+        return None
+    return Command(DELETE, _reference(reference.group("value")))
+
+
+def _parse_receipt(text: str) -> Optional[Command]:
+    if not re.search(r"\breceipt\b", text, re.IGNORECASE):
+        return None
+    received_by = RECEIVED_BY.search(text)
+    if received_by:
+        text = text[:received_by.start()]
+    reference, text = _take(REFERENCE, text)
+    latest, text = _take(LATEST, text)
+    if bool(reference) == bool(latest) or not _only_filler(text):
+        return None
+    return Command(RECEIPT, _reference(reference.group("value")) if reference else None,
+                   received_by=received_by.group("value") if received_by else None)
+
+
+def parse_command(prompt: str, today: Optional[date] = None) -> Optional[Command]:
+    """
+    Parses an add, delete or receipt prompt written in the fixed form of the
+    prompt placeholder, e.g. "Add a transaction of 30 AED, reference 200, for
+    today at rate of 2.7". Every part of the command has to be recognised;
+    prompts with missing, repeated or unknown parts return None.
+    :param prompt: Prompt as typed by the user
+    :param today: Date that "today" refers to, defaults to the current date
+    :return: Command or None if the prompt is not certain to mean one
+    """
+    text = prompt.strip()
+    for action, verb in VERBS:
+        if verb.match(text):
+            if action == ADD:
+                return _parse_add(text, today or date.today())
+            if action == DELETE:
+                return _parse_delete(text)
+            return _parse_receipt(text)
+    return None
+
+
+class FastPath:
+    """
+    Runs templated prompts against the workbook directly instead of through
+    Rasa, Duckling and the action server. Prompts parse_command() cannot
+    read with certainty are left to the caller to send to Rasa.
+    Attributes:
+        pool (WorkbookPool): Source of open workbooks
+        hits (int): Prompts handled locally
+        misses (int): Prompts left to Rasa
+    Methods:
+        handle(prompt, filepath): Runs a prompt, returning its replies.
+        hit_rate: Share of prompts handled locally.
+    """
+
+    def __init__(self, pool: Optional[WorkbookPool] = None) -> None:
+        """
+        Initializes the fast path.
+        :param pool: Source of open workbooks, defaults to a pool of its own
+        """
+        self.pool = pool or WorkbookPool(max_workbooks=2)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return f"Fast path handled {self.hits} of {self.hits + self.misses} prompts ({self.hit_rate:.0%})"
+
+    def handle(self, prompt: str, filepath) -> Optional[List[str]]:
+        """
+        Runs a prompt locally if it parses as a command.
+        Receipt prompts that do not name who receives the receipt are left to
+        Rasa, which asks for the name.
+        :param prompt: Prompt as typed by the user
+        :param filepath: Path to the Excel workbook
+        :return: Replies to show the user, or None if the prompt should go to Rasa
+        """
+        command = parse_command(prompt)
+        if command is not None and command.action == RECEIPT and not command.received_by:
+            command = None
+        if command is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return execute(command, self.pool.acquire(filepath))
+
+
+def execute(command: Command, manager: ExcelManager) -> List[str]:
+    """
+    Applies a command to a workbook.
+    :param command:
+    :param manager: ExcelManager of the workbook
+    :return: Replies to show the user, worded as the action server words them
+    """
+    if command.action == ADD:
+        transaction = command.transaction
+        manager.add(transaction)
+        return [f"Adding transaction amount: {transaction.amount} {transaction.currency}, "
+                f"conversion rate: {transaction.conversion_rate}, reference ID: {transaction.reference_id}, "
+                f"time: {transaction.transaction_date}",
+                "Transaction added successfully."]
+    if command.action == DELETE:
+        if manager.delete_transaction(reference_id=command.reference_id):
+            return [f"Transaction {command.reference_id} deleted."]
+        return [f"No transaction with reference ID {command.reference_id} was found, no changes made"]
+
+    transaction = manager.latest() if command.reference_id is None \
+        else manager.find_by_reference(command.reference_id)
+    if transaction is None:
+        return ["No such transaction was found, no receipt generated"]
+    name = receipt.generate_receipt_for(transaction, received_by=command.received_by)
+    return [f"Receipt generated: {name}"]
@@ -0,0 +1,64 @@
+import argparse
+import csv
+import json
+from typing import Any, Dict, Iterator, Optional
+from core.books import ExcelManager
+from core.transaction import FIELDS
+
+
+def iter_csv(filepath, columns: Optional[Dict[str, str]] = None, delimiter: str = ",") -> Iterator[Dict[str, Any]]:
+    """
+    Streams transactions from a CSV export one row at a time.
+    Columns are matched to FIELDS by name, either as written in FIELDS
+    ("conversion_rate") or as the workbook headers ("Conversion Rate"), case insensitive.
+    :param filepath: Path to the CSV file
+    :param columns: Optional mapping of field name to CSV column name, for exports
+    with their own headers
+    :param delimiter: Field delimiter
+    :return: Iterator of transactions keyed by FIELDS
+    """
+    with open(filepath, "r", newline="", encoding="utf-8-sig") as csv_file:
+        reader = csv.DictReader(csv_file, delimiter=delimiter)
+        lookup = {_normalise(name): name for name in reader.fieldnames or []}
+        source = {name: (columns or {}).get(name) or lookup.get(_normalise(name)) for name in FIELDS}
+        for row in reader:
+            yield {name: row.get(column) if column else None for name, column in source.items()}
+
+
+def iter_jsonl(filepath) -> Iterator[Any]:
+    """
+    Streams transactions from a JSON Lines export one line at a time.
+    Each line holds either an object keyed by FIELDS or an array of five values.
+    Lines that are not valid JSON are passed through as None so that they are
+    counted as rejected by ExcelManager.add_transactions().
+    :param filepath: Path to the JSONL file
+    :return: Iterator of transactions
+    """
+    with open(filepath, "r", encoding="utf-8") as jsonl_file:
+        for line in jsonl_file:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield None
+
+
+def _normalise(name: str) -> str:
+    return name.strip().lower().replace(" ", "_")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a bank export into a Calcite workbook")
+    parser.add_argument("workbook", help="Path to the Excel workbook")
+    parser.add_argument("source", help="Path to a .csv or .jsonl export")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Import transactions whose reference ID already exists")
+    args = parser.parse_args()
+
+    transactions = iter_jsonl(args.source) if args.source.endswith(".jsonl") else iter_csv(args.source)
+    report = ExcelManager(args.workbook).add_transactions(transactions,
+                                                         skip_duplicates=not args.keep_duplicates)
+    print(report)
+    for error in report.errors:
+        print(error)
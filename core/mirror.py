@@ -0,0 +1,186 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from core.books import ExcelManager, LedgerObserver, parse_date
+from core.transaction import Transaction
+
+INITIAL_CAPACITY = 1024
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class LedgerMirror(LedgerObserver):
+    """
+    A columnar, NumPy backed copy of a ledger for fast aggregate queries.
+    Amounts and conversion rates are float arrays, currencies are stored as
+    integer codes into a list of categories, and dates are datetime64[D]
+    (NaT where a date cannot be parsed). Attached to an ExcelManager, the
+    mirror follows every add and delete incrementally.
+    Attributes:
+        categories (list): Currency codes, indexed by the codes array
+    Methods:
+        attach(manager): Mirrors a workbook and follows its writes.
+        totals_by_currency(): Sum of amounts per currency.
+        converted_total(currency): Sum of amount * conversion rate.
+        monthly_totals(currency): Sum of amounts per calendar month.
+        top_n(n, currency): Largest transactions by amount.
+    """
+
+    def __init__(self, manager: Optional[ExcelManager] = None) -> None:
+        """
+        Initializes an empty mirror, attaching it to a manager if given.
+        :param manager: ExcelManager to mirror
+        """
+        self.categories: List[str] = []
+        self._category_codes: Dict[str, int] = {}
+        self._allocate(INITIAL_CAPACITY)
+        if manager is not None:
+            self.attach(manager)
+
+    def __len__(self) -> int:
+        return int(self.alive[:self.size].sum())
+
+    def _allocate(self, capacity: int) -> None:
+        self.size = 0
+        self.amounts = np.empty(capacity, dtype=np.float64)
+        self.rates = np.empty(capacity, dtype=np.float64)
+        self.codes = np.empty(capacity, dtype=np.int32)
+        self.dates = np.empty(capacity, dtype='datetime64[D]')
+        self.rows = np.empty(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.references = np.empty(capacity, dtype=object)
+
+    def _grow(self) -> None:
+        """
+        Doubles the capacity of every column, keeping appends amortised O(1).
+        :return: None
+        """
+        for name in ('amounts', 'rates', 'codes', 'dates', 'rows', 'alive', 'references'):
+            column = getattr(self, name)
+            grown = np.zeros(len(column) * 2, dtype=column.dtype) if name == 'alive' \
+                else np.empty(len(column) * 2, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def _code(self, currency: Any) -> int:
+        currency = str(currency).upper() if currency is not None else ''
+        code = self._category_codes.get(currency)
+        if code is None:
+            code = self._category_codes[currency] = len(self.categories)
+            self.categories.append(currency)
+        return code
+
+    def attach(self, manager: ExcelManager) -> None:
+        """
+        Loads the manager's current rows and follows its future writes.
+        :param manager:
+        :return: None
+        """
+        self.load(manager.iter_rows())
+        manager.add_observer(self)
+
+    def load(self, rows: Iterable[Tuple[int, Transaction]]) -> None:
+        """
+        Replaces the mirror's contents.
+        :param rows: (row number, Transaction) pairs
+        :return: None
+        """
+        self._allocate(max(len(self.amounts), INITIAL_CAPACITY))
+        for row_number, transaction in rows:
+            self.append(row_number, transaction)
+
+    def append(self, row_number: int, transaction: Transaction) -> None:
+        amount, currency, conversion_rate, transaction_date, reference_id = transaction
+        if self.size == len(self.amounts):
+            self._grow()
+        i = self.size
+        self.amounts[i] = _to_float(amount)
+        self.rates[i] = _to_float(conversion_rate)
+        self.codes[i] = self._code(currency)
+        parsed = parse_date(transaction_date)
+        self.dates[i] = np.datetime64(parsed, 'D') if parsed else np.datetime64('NaT')
+        self.rows[i] = row_number
+        self.alive[i] = True
+        self.references[i] = reference_id
+        self.size += 1
+
+    def on_add(self, manager: ExcelManager, row_number: int, transaction: Transaction) -> None:
+        self.append(row_number, transaction)
+
+    def on_delete(self, manager: ExcelManager, row_number: int, shifted: bool) -> None:
+        rows = self.rows[:self.size]
+        i = np.searchsorted(rows, row_number)
+        # Rows are appended in ascending order, but dead entries keep their old numbers
+        while i < self.size and rows[i] == row_number and not self.alive[i]:
+            i += 1
+        if i < self.size and rows[i] == row_number:
+            self.alive[i] = False
+        if shifted:
+            rows[rows > row_number] -= 1
+
+    def on_reset(self, manager: ExcelManager) -> None:
+        self.load(manager.iter_rows())
+
+    def _mask(self, currency: Optional[str] = None) -> np.ndarray:
+        mask = self.alive[:self.size].copy()
+        if currency is not None:
+            code = self._category_codes.get(currency.upper())
+            if code is None:
+                mask[:] = False
+            else:
+                mask &= self.codes[:self.size] == code
+        return mask
+
+    def totals_by_currency(self) -> Dict[str, float]:
+        """
+        Sums amounts per currency.
+        :return: {currency: total}
+        """
+        mask = self._mask() & ~np.isnan(self.amounts[:self.size])
+        totals = np.bincount(self.codes[:self.size][mask], weights=self.amounts[:self.size][mask],
+                             minlength=len(self.categories))
+        counts = np.bincount(self.codes[:self.size][mask], minlength=len(self.categories))
+        return {currency: float(totals[code]) for code, currency in enumerate(self.categories) if counts[code]}
+
+    def converted_total(self, currency: Optional[str] = None) -> float:
+        """
+        Sums amount * conversion rate, skipping rows without a usable rate.
+        :param currency: Only include transactions in this currency
+        :return: Converted total
+        """
+        mask = self._mask(currency)
+        return float(np.nansum(self.amounts[:self.size][mask] * self.rates[:self.size][mask]))
+
+    def monthly_totals(self, currency: Optional[str] = None) -> Dict[str, float]:
+        """
+        Sums amounts per calendar month, skipping undated rows.
+        :param currency: Only include transactions in this currency
+        :return: {"YYYY-MM": total} in chronological order
+        """
+        mask = self._mask(currency) & ~np.isnat(self.dates[:self.size]) & ~np.isnan(self.amounts[:self.size])
+        months = self.dates[:self.size][mask].astype('datetime64[M]')
+        unique_months, inverse = np.unique(months, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.amounts[:self.size][mask], minlength=len(unique_months))
+        return {str(month): float(total) for month, total in zip(unique_months, totals)}
+
+    def top_n(self, n: int, currency: Optional[str] = None) -> List[Tuple[Any, float, str]]:
+        """
+        Finds the largest transactions by amount.
+        :param n: Number of transactions to return
+        :param currency: Only include transactions in this currency
+        :return: [(reference ID, amount, currency)] largest first
+        """
+        indices = np.flatnonzero(self._mask(currency) & ~np.isnan(self.amounts[:self.size]))
+        if n <= 0 or not len(indices):
+            return []
+        amounts = self.amounts[indices]
+        if n < len(indices):
+            top = np.argpartition(-amounts, n - 1)[:n]
+            indices, amounts = indices[top], amounts[top]
+        order = np.argsort(-amounts, kind='stable')
+        return [(self.references[i], float(self.amounts[i]), self.categories[self.codes[i]])
+                for i in indices[order]]
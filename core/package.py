@@ -0,0 +1,115 @@
+from typing import Dict, Optional
+from zipfile import ZipFile, ZIP_DEFLATED
+from openpyxl.packaging.manifest import Manifest
+from openpyxl.packaging.relationship import get_rels_path
+from openpyxl.reader.excel import _find_workbook_part
+from openpyxl.reader.workbook import WorkbookParser
+from openpyxl.styles.stylesheet import write_stylesheet
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.xml.constants import ARC_CONTENT_TYPES, ARC_CUSTOM, ARC_STYLE
+from openpyxl.xml.functions import fromstring, tostring
+
+
+def worksheet_parts(archive: ZipFile) -> Dict[str, str]:
+    """
+    Maps each worksheet title to its part inside an xlsx package.
+    :param archive: Open xlsx package
+    :return: {sheet title: zip member name}
+    """
+    package = Manifest.from_tree(fromstring(archive.read(ARC_CONTENT_TYPES)))
+    workbook_part = _find_workbook_part(package)
+    parser = WorkbookParser(archive, workbook_part.PartName[1:])
+    parser.parse()
+    return {sheet.name: rel.target.lstrip('/') for sheet, rel in parser.find_sheets()}
+
+
+def _cell_key(cell) -> tuple:
+    value = cell.value
+    if not isinstance(value, (str, int, float, type(None))):
+        value = repr(value)
+    return cell.row, cell.column, value, tuple(cell._style)
+
+
+def workbook_fingerprint(wb, ws) -> int:
+    """
+    Fingerprints everything save_worksheet() copies from the package as it is:
+    the sheets and their order, the defined names, and the cells, styles,
+    merged cells and dimensions of every worksheet other than ws.
+    :param wb: Workbook
+    :param ws: The ledger worksheet, which is left out
+    :return: Hash that changes whenever any of those change
+    """
+    parts = [tuple(wb.sheetnames),
+             tuple(sorted((name, defined_name.attr_text) for name, defined_name in wb.defined_names.items()))]
+    for sheet in wb.worksheets:
+        if sheet is ws:
+            continue
+        parts.append((
+            sheet.title,
+            sheet.sheet_state,
+            tuple(sorted((name, defined_name.attr_text) for name, defined_name in sheet.defined_names.items())),
+            tuple(sorted(str(merged) for merged in sheet.merged_cells.ranges)),
+            tuple((key, dimension.hidden, dimension.height) for key, dimension in sheet.row_dimensions.items()),
+            tuple((key, dimension.hidden, dimension.width) for key, dimension in sheet.column_dimensions.items()),
+            tuple(_cell_key(cell) for cell in sheet._cells.values()),
+        ))
+    return hash(tuple(parts))
+
+
+def save_worksheet(wb, ws, source_path, target_path, fingerprint: int) -> bool:
+    """
+    Writes a copy of the package at source_path to target_path in which only
+    the part for one worksheet is regenerated. Every other member keeps its
+    original content, so workbooks with extra sheets, charts or pivot caches
+    next to ws do not pay to serialise them again.
+    Only worksheets whose part stands alone qualify: no charts, images, tables,
+    comments, hyperlinks or pivots, and no relationships in the original
+    package. Saving is also refused when the stylesheet or the custom document
+    properties would need a new entry in the package manifest. Strings need no
+    special care, as openpyxl writes them inline rather than to sharedStrings.xml.
+    Anything else that changed since source_path was written, e.g. a sheet
+    added or edited or a name defined, also needs a full save.
+    :param wb: Workbook loaded from source_path
+    :param ws: The ledger worksheet, the only one regenerated
+    :param source_path: Path to the package wb was loaded from
+    :param target_path: Path to write the new package to
+    :param fingerprint: workbook_fingerprint(wb, ws) when source_path was loaded or written
+    :return: False when nothing was written and a full save is needed instead
+    """
+    if workbook_fingerprint(wb, ws) != fingerprint:
+        return False
+    if ws._charts or ws._images or ws._pivots or ws.tables or ws.legacy_drawing is not None \
+            or wb.vba_archive is not None:
+        return False
+
+    with ZipFile(source_path) as source:
+        names = set(source.namelist())
+        member = worksheet_parts(source).get(ws.title)
+        if member is None or get_rels_path(member) in names:
+            return False
+
+        writer = WorksheetWriter(ws)
+        try:
+            writer.write()
+            if writer._rels or ws._comments:
+                return False
+            # Writing the cells registers their styles, so compare the stylesheet afterwards
+            if tostring(write_stylesheet(wb)) != source.read(ARC_STYLE):
+                return False
+            custom: Optional[bytes] = None
+            if len(wb.custom_doc_props):
+                if ARC_CUSTOM not in names:
+                    return False
+                custom = tostring(wb.custom_doc_props.to_tree())
+
+            with ZipFile(target_path, 'w', ZIP_DEFLATED, allowZip64=True) as target:
+                for info in source.infolist():
+                    if info.filename == member:
+                        target.write(writer.out, member)
+                    elif info.filename == ARC_CUSTOM and custom is not None:
+                        target.writestr(info, custom)
+                    else:
+                        target.writestr(info, source.read(info))
+        finally:
+            writer.cleanup()
+    return True
@@ -0,0 +1,197 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from openpyxl import Workbook
+from core.books import parse_date, reference_key
+from core.pool import WorkbookPool
+from core.transaction import Transaction
+
+GRANULARITIES = {"month": "%Y-%m", "year": "%Y"}
+UNDATED_PARTITION = "undated"
+# Rewrite the index log once it holds this many times more lines than live entries
+INDEX_COMPACTION_RATIO = 4
+
+
+class PartitionedLedger:
+    """
+    A ledger split into one workbook per month or year of transaction date.
+    Partitions live next to each other as <name>-<period>.xlsx. A manifest,
+    <name>.manifest.json, records the granularity and the partitions that exist,
+    and an append-only log, <name>.index.jsonl, maps reference IDs to partitions
+    so lookups open only the partition holding the transaction.
+    Writes load and save only the partition they touch, so their cost is bounded
+    by the size of one period rather than the whole history.
+    Attributes:
+        directory (Path): Folder holding the partitions
+        name (str): Prefix shared by the partition files
+        granularity (str): "month" or "year"
+    Methods:
+        add_transaction(...): Adds a transaction to the partition for its date.
+        add(transaction): Adds a Transaction to the partition for its date.
+        delete_transaction(reference_id): Deletes a transaction from its partition.
+        find_by_reference(reference_id): Looks a transaction up across partitions.
+        generate_receipt_by_id(received_by, reference_id): Generates a receipt by reference ID.
+        partitions(): Lists the partitions that exist.
+    """
+
+    def __init__(self, directory, name: str = "Ledger", granularity: str = "month",
+                 max_open_partitions: int = 4) -> None:
+        """
+        Opens a partitioned ledger, creating its manifest if needed.
+        :param directory: Folder holding the partitions
+        :param name: Prefix shared by the partition files
+        :param granularity: "month" or "year", ignored when the manifest already exists
+        :param max_open_partitions: Number of partitions kept loaded
+        """
+        self.directory = Path(directory)
+        self.name = name
+        self.manifest_path = self.directory / f"{name}.manifest.json"
+        self.index_path = self.directory / f"{name}.index.jsonl"
+        self.pool = WorkbookPool(max_workbooks=max_open_partitions)
+
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            self.granularity = manifest["granularity"]
+            self._partitions: Dict[str, str] = manifest["partitions"]
+        else:
+            if granularity not in GRANULARITIES:
+                raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+            self.granularity = granularity
+            self._partitions = {}
+            self._write_manifest()
+
+        # Reference ID, as given by reference_key() -> partitions holding it, oldest first
+        self.index: Dict[str, List[str]] = {}
+        self._index_lines = 0
+        self._live_entries = 0
+        self._load_index()
+
+    def partitions(self) -> List[str]:
+        return sorted(self._partitions)
+
+    def partition_key(self, transaction_date: Any) -> str:
+        parsed = parse_date(transaction_date)
+        if parsed is None:
+            return UNDATED_PARTITION
+        return parsed.strftime(GRANULARITIES[self.granularity])
+
+    def _write_manifest(self) -> None:
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"granularity": self.granularity, "partitions": self._partitions}, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def _load_index(self) -> None:
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, "r") as f:
+            for line in f:
+                try:
+                    op, reference_id, key = json.loads(line)
+                except ValueError:
+                    # A torn final line left behind by a crash mid-append
+                    break
+                self._apply_index(op, reference_id, key)
+                self._index_lines += 1
+
+    def _apply_index(self, op: str, reference_id: Any, key: str) -> None:
+        reference_id = reference_key(reference_id)
+        if op == "add":
+            self.index.setdefault(reference_id, []).append(key)
+            self._live_entries += 1
+        elif key in self.index.get(reference_id, ()):
+            self.index[reference_id].remove(key)
+            self._live_entries -= 1
+            if not self.index[reference_id]:
+                del self.index[reference_id]
+
+    def _log_index(self, op: str, reference_id: Any, key: str) -> None:
+        """
+        Applies an index change and appends it to the index log.
+        :return: None
+        """
+        self._apply_index(op, reference_id, key)
+        with open(self.index_path, "a") as f:
+            f.write(json.dumps([op, reference_id, key], default=str) + "\n")
+        self._index_lines += 1
+        if self._index_lines > INDEX_COMPACTION_RATIO * max(self._live_entries, 1024):
+            self._compact_index()
+
+    def _compact_index(self) -> None:
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w") as f:
+            for reference_id, keys in self.index.items():
+                for key in keys:
+                    f.write(json.dumps(["add", reference_id, key], default=str) + "\n")
+        os.replace(temp_path, self.index_path)
+        self._index_lines = self._live_entries
+
+    def _partition(self, key: str, create: bool = False):
+        """
+        Returns the manager for a partition, loading only that workbook.
+        :param key: Partition period, e.g. "2024-10"
+        :param create: Create the partition's workbook if it does not exist
+        :return: ExcelManager or None if the partition does not exist
+        """
+        if key not in self._partitions:
+            if not create:
+                return None
+            filename = f"{self.name}-{key}.xlsx"
+            Workbook().save(self.directory / filename)
+            self._partitions[key] = filename
+            self._write_manifest()
+        return self.pool.acquire(self.directory / self._partitions[key])
+
+    def add_transaction(self, amount: float, currency: str, conversion_rate: float,
+                        transaction_date: str, reference_id: str) -> str:
+        """
+        Adds a transaction to the partition for its date.
+        :return: Key of the partition written to
+        """
+        return self.add(Transaction(amount, currency, conversion_rate, transaction_date, reference_id))
+
+    def add(self, transaction: Transaction) -> str:
+        """
+        Adds a Transaction to the partition for its date.
+        :param transaction:
+        :return: Key of the partition written to
+        """
+        key = self.partition_key(transaction.transaction_date)
+        self._partition(key, create=True).add(transaction)
+        if transaction.reference_id is not None:
+            self._log_index("add", transaction.reference_id, key)
+        return key
+
+    def delete_transaction(self, reference_id: Any) -> bool:
+        keys = self.index.get(reference_key(reference_id))
+        if not keys:
+            return False
+        key = keys[0]
+        manager = self._partition(key)
+        if manager is None or not manager.delete_transaction(reference_id=reference_id):
+            return False
+        self._log_index("delete", reference_id, key)
+        return True
+
+    def find_by_reference(self, reference_id: Any) -> Optional[Transaction]:
+        keys = self.index.get(reference_key(reference_id))
+        if not keys:
+            return None
+        manager = self._partition(keys[0])
+        return manager.find_by_reference(reference_id) if manager is not None else None
+
+    def generate_receipt_by_id(self, received_by, reference_id):
+        keys = self.index.get(reference_key(reference_id))
+        manager = self._partition(keys[0]) if keys else None
+        if manager is None:
+            return "No such transaction was found, no receipt generated"
+        return manager.generate_receipt_by_id(received_by, reference_id)
+
+    def flush(self) -> None:
+        """
+        Saves deferred writes and closes every loaded partition.
+        :return: None
+        """
+        self.pool.clear()
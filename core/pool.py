@@ -0,0 +1,165 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from core.books import ExcelManager
+
+# openpyxl keeps roughly this many bytes in memory per byte of xlsx on disk
+MEMORY_PER_FILE_BYTE = 50
+
+
+class WorkbookPool:
+    """
+    A process-wide, least recently used cache of open Excel workbooks.
+    A cached workbook is reused only while the file on disk still has the
+    modification time and size its manager last loaded or saved, so edits
+    made outside the pool are always picked up.
+    Attributes:
+        max_workbooks (int): Maximum number of workbooks kept open
+        max_memory (int): Approximate memory budget in bytes for open workbooks
+    Methods:
+        acquire(filepath): Returns an up-to-date ExcelManager for a workbook.
+        evict(filepath): Closes a workbook, saving deferred writes first.
+        clear(): Closes every workbook in the pool.
+    """
+
+    def __init__(self, max_workbooks: int = 8, max_memory: int = 512 * 1024 * 1024) -> None:
+        """
+        Initializes an empty pool.
+        :param max_workbooks: Maximum number of workbooks kept open
+        :param max_memory: Approximate memory budget in bytes for open workbooks
+        """
+        self.max_workbooks = max_workbooks
+        self.max_memory = max_memory
+        self._managers: "OrderedDict[str, ExcelManager]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._managers)
+
+    def __contains__(self, filepath) -> bool:
+        return self._key(filepath) in self._managers
+
+    @staticmethod
+    def _key(filepath) -> str:
+        return os.path.abspath(os.fspath(filepath))
+
+    @staticmethod
+    def estimated_memory(manager: ExcelManager) -> int:
+        """
+        Estimates the memory held by an open workbook from its size on disk.
+        :param manager:
+        :return: Estimated size in bytes
+        """
+        _, size = manager.disk_signature or (0, 0)
+        return size * MEMORY_PER_FILE_BYTE
+
+    def acquire(self, filepath) -> ExcelManager:
+        """
+        Returns an open manager for a workbook, loading it only when it is not
+        pooled yet or was changed on disk since it was pooled.
+        :param filepath: Path to the Excel workbook
+        :return: ExcelManager
+        """
+        key = self._key(filepath)
+        with self._lock:
+            manager = self._managers.get(key)
+            if manager is not None and not manager.is_stale():
+                self._managers.move_to_end(key)
+                self.hits += 1
+                return manager
+
+            self.misses += 1
+
+        # Load outside the lock so that other workbooks can be acquired meanwhile
+        manager = ExcelManager(filepath)
+        with self._lock:
+            self._managers[key] = manager
+            self._managers.move_to_end(key)
+            self._shrink()
+        return manager
+
+    def evict(self, filepath) -> None:
+        """
+        Removes a workbook from the pool, saving its deferred writes first.
+        :param filepath: Path to the Excel workbook
+        :return: None
+        """
+        with self._lock:
+            manager = self._managers.pop(self._key(filepath), None)
+            if manager is not None and not manager.is_stale():
+                manager.flush()
+
+    def clear(self) -> None:
+        """
+        Removes every workbook from the pool.
+        :return: None
+        """
+        with self._lock:
+            for key in list(self._managers):
+                self.evict(key)
+
+    def _shrink(self) -> None:
+        """
+        Evicts least recently used workbooks until the pool fits its limits.
+        The most recently used workbook is always kept.
+        :return: None
+        """
+        while len(self._managers) > 1 and (
+                len(self._managers) > self.max_workbooks
+                or sum(map(self.estimated_memory, self._managers.values())) > self.max_memory):
+            self.evict(next(iter(self._managers)))
+
+
+class WorkbookWriter:
+    """
+    Runs workbook operations for asyncio code on a pool of worker threads.
+    Operations on the same workbook run one at a time in submission order,
+    while operations on different workbooks run in parallel, and the event
+    loop is never blocked by loading or saving a workbook.
+    Attributes:
+        pool (WorkbookPool): Source of open workbooks
+    Methods:
+        submit(filepath, operation): Runs operation(manager) and returns its result.
+        shutdown(): Waits for running operations and stops the worker threads.
+    """
+
+    def __init__(self, pool: WorkbookPool, max_workers: Optional[int] = None) -> None:
+        """
+        Initializes the writer.
+        :param pool: Source of open workbooks
+        :param max_workers: Number of worker threads, defaults to the pool's workbook limit
+        """
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or pool.max_workbooks,
+                                            thread_name_prefix="workbook-writer")
+        # One FIFO lock per workbook, so queued operations keep their order
+        self._file_locks: Dict[str, asyncio.Lock] = {}
+
+    async def submit(self, filepath, operation: Callable[[ExcelManager], Any]) -> Any:
+        """
+        Queues an operation behind earlier ones for the same workbook.
+        :param filepath: Path to the Excel workbook
+        :param operation: Called with the workbook's ExcelManager on a worker thread
+        :return: The operation's result
+        """
+        key = WorkbookPool._key(filepath)
+        lock = self._file_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._run, filepath, operation)
+
+    def _run(self, filepath, operation: Callable[[ExcelManager], Any]) -> Any:
+        return operation(self.pool.acquire(filepath))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+# Shared by every action handled by this process
+workbook_pool = WorkbookPool()
+workbook_writer = WorkbookWriter(workbook_pool)
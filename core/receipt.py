@@ -1,82 +1,869 @@
 from PIL import Image, ImageDraw, ImageFont
+import atexit
+import hashlib
+import io
 import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+from core.transaction import parse_date
 
 
 CONFIG_FILE_PATH = (Path(__file__).parent.parent / 'config' / 'config.json').resolve()
+TEMPLATE_PATH = (Path(__file__).parent.parent / "assets" / "receipt_template.png").resolve()
+FONT_PATH = (Path(__file__).parent.parent / 'fonts' / 'ttf' / 'JetBrainsMono-Regular.ttf').resolve()
+RECEIPTS_DIR = (Path(__file__).parent.parent / "receipts").resolve()
+FONT_SIZE = 12
+SIGNATURE_MAX_SIZE = (170, 70)
+# Batches smaller than this are rendered in the calling process, as starting workers costs more
+PARALLEL_THRESHOLD = 16
+# Receipts handed to a worker process at once
+MAX_CHUNK_SIZE = 64
+CACHE_INDEX_NAME = ".receipt-index.json"
+# Receipts remembered by the cache index, least recently used dropped first
+MAX_CACHE_ENTRIES = 2048
+# Part of every cache key: bump it whenever a change to this module alters how receipts look
+RENDER_VERSION = 1
+# JPEG quality of the pages of a PDF statement
+STATEMENT_QUALITY = 85
+# Currencies listed on a statement's summary page before the rest are counted together
+MAX_SUMMARY_CURRENCIES = 12
 
+# Where each field is drawn on the template (585x451)
+POSITIONS = {
+    "reference_id_value": (460, 77),  # After "No." label
+    "date_value": (130, 162),  # After "DATE" label
+    "from_person_value": (130, 187),  # After "FROM" (payer) label
+    "acct_paid_amount_value": (170, 302),  # Column for amount
+    "acct_paid_currency_text": (230, 302),  # Placed after the amount
+    "received_by_value": (400, 305),  # Name of receiver
+    "signature_area": (400, 330)
+}
 
-def generate_receipt(
+# Decoded resources, keyed by name, each stored with the version of the files it was built from
+_resources: Dict[Any, Tuple[Any, Any]] = {}
+_resources_lock = threading.Lock()
+
+
+def _file_version(path) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _cached(key: Any, version: Any, build: Callable[[], Any]) -> Any:
+    """
+    Returns a cached resource, building it again when its version changed.
+
+    Args:
+        key: Name of the resource.
+        version: Versions of the files the resource is built from.
+        build (Callable): Builds the resource.
+    """
+    with _resources_lock:
+        cached = _resources.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    resource = build()
+    with _resources_lock:
+        _resources[key] = (version, resource)
+    return resource
+
+
+def clear_resource_cache() -> None:
+    with _resources_lock:
+        _resources.clear()
+
+
+def _read_config() -> dict:
+    with open(CONFIG_FILE_PATH, "r") as file:
+        return json.load(file)
+
+
+def load_config() -> dict:
+    """
+    Returns the user configuration, read again only when config.json changes.
+    The returned dictionary is shared and must not be modified.
+    """
+    return _cached("config", _file_version(CONFIG_FILE_PATH), _read_config)
+
+
+def load_font() -> ImageFont.FreeTypeFont:
+    return _cached("font", _file_version(FONT_PATH), lambda: ImageFont.truetype(FONT_PATH, size=FONT_SIZE))
+
+
+def load_template() -> Image.Image:
+    return _cached("template", _file_version(TEMPLATE_PATH), lambda: Image.open(TEMPLATE_PATH).convert("RGB"))
+
+
+def _prepare_signature(signature_path) -> Image.Image:
+    signature_img = Image.open(signature_path).convert("RGBA")
+    signature_img.thumbnail(SIGNATURE_MAX_SIZE)
+    return signature_img
+
+
+def load_signature(signature_path) -> Optional[Image.Image]:
+    """
+    Returns the signature scaled to fit the signature area, or None if it cannot be read.
+
+    Args:
+        signature_path (str): Path to the signature image.
+    """
+    try:
+        return _cached(("signature", signature_path), _file_version(signature_path),
+                       lambda: _prepare_signature(signature_path))
+    except FileNotFoundError:
+        print(f"Warning: Signature file not found at {signature_path}")
+    except Exception as e:
+        print(f"Warning: Could not process signature image: {e}")
+    return None
+
+
+def _build_base_image(from_person: str, signature: Optional[Image.Image], text_color: str) -> Image.Image:
+    img = load_template().copy()
+    draw = ImageDraw.Draw(img)
+    draw.text(POSITIONS["from_person_value"], from_person, fill=text_color, font=load_font())
+    if signature is not None:
+        img.paste(signature, POSITIONS["signature_area"], signature)
+    return img
+
+
+def base_image(text_color: str = "black") -> Image.Image:
+    """
+    Returns the template with the fields that are the same on every receipt,
+    the payer's name and signature, already drawn. It is rebuilt only when the
+    template, font, config.json or signature file changes.
+    The returned image is shared: copy it before drawing on it.
+
+    Args:
+        text_color (str, optional): Color of the text. Defaults to "black".
+    """
+    config = load_config()
+    from_person = config["user"]["name"]
+    signature_path = config["user"]["signaturePath"]
+    signature = load_signature(signature_path)
+    try:
+        signature_version = _file_version(signature_path) if signature is not None else None
+    except OSError:
+        signature_version = None
+    version = (_file_version(TEMPLATE_PATH), _file_version(FONT_PATH), _file_version(CONFIG_FILE_PATH),
+               signature_version)
+    return _cached(("base", text_color), version, lambda: _build_base_image(from_person, signature, text_color))
+
+
+@dataclass(frozen=True)
+class Encoder:
+    """
+    How a rendered receipt is turned into bytes.
+    Attributes:
+        format (str): "png", "webp" or "jpeg"
+        quality (int): Lossy quality from 1 to 100, for WebP and JPEG
+        compress_level (int): zlib level from 0 (fastest) to 9 (smallest), for PNG
+        colors (int): Reduce a PNG to a palette of this many colors, which receipts,
+        being flat text on a plain template, survive without visible loss
+    """
+    format: str = "png"
+    quality: Optional[int] = None
+    compress_level: Optional[int] = None
+    colors: Optional[int] = None
+
+    @property
+    def extension(self) -> str:
+        return ".jpg" if self.format == "jpeg" else f".{self.format}"
+
+    def encode(self, img: Image.Image) -> "EncodedReceipt":
+        """
+        Encodes an image in memory.
+
+        Args:
+            img (Image): The rendered receipt.
+        """
+        if self.format not in ("png", "webp", "jpeg"):
+            raise ValueError(f"Unsupported receipt format: {self.format}")
+        start = time.perf_counter()
+        options = {}
+        if self.quality is not None:
+            options["quality"] = self.quality
+        if self.compress_level is not None:
+            options["compress_level"] = self.compress_level
+        if self.colors:
+            img = img.quantize(self.colors, method=Image.Quantize.FASTOCTREE)
+        buffer = io.BytesIO()
+        img.save(buffer, self.format.upper(), **options)
+        return EncodedReceipt(buffer.getvalue(), self, time.perf_counter() - start)
+
+
+@dataclass
+class EncodedReceipt:
+    """
+    A receipt encoded in memory.
+    Attributes:
+        data (bytes): The encoded image
+        encoder (Encoder): How it was encoded
+        seconds (float): Time spent encoding
+    """
+    data: bytes
+    encoder: Encoder
+    seconds: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def __str__(self) -> str:
+        return f"{self.encoder.format.upper()}, {self.size / 1024:.1f} KB encoded in {self.seconds * 1000:.1f} ms"
+
+
+# Named encoder settings, selectable with "receipts": {"format": <name>} in config.json.
+# "png" keeps Pillow's defaults; "png-palette" is about a fifth of the size (22% on the
+# bundled template) and faster to encode.
+ENCODER_PRESETS = {
+    "png": Encoder("png"),
+    "png-fast": Encoder("png", compress_level=1),
+    "png-palette": Encoder("png", colors=64),
+    "webp": Encoder("webp", quality=80),
+    "jpeg": Encoder("jpeg", quality=85),
+}
+
+
+def configured_encoder() -> Encoder:
+    """
+    Returns the encoder named in config.json, PNG if none is set.
+    """
+    name = load_config().get("receipts", {}).get("format", "png")
+    if name not in ENCODER_PRESETS:
+        raise ValueError(f"Unknown receipt format {name!r}, expected one of {', '.join(ENCODER_PRESETS)}")
+    return ENCODER_PRESETS[name]
+
+
+def receipt_key(received_by: str, reference_id: str, transaction_date: str, amount: Any, currency: str,
+                text_color: str, encoder: Encoder) -> str:
+    """
+    Hashes everything a receipt's pixels and bytes depend on: its fields, the
+    issuer's name, and the versions of the template, font and signature files.
+
+    Args:
+        received_by (str): Name of the person receiving the receipt.
+        reference_id (str): The receipt reference number.
+        transaction_date (str): The date of the transaction.
+        amount (float): The amount paid.
+        currency (str): The currency of the transaction.
+        text_color (str): Color of the text.
+        encoder (Encoder): How the receipt is encoded.
+    """
+    config = load_config()
+    signature_path = config["user"]["signaturePath"]
+    try:
+        signature_version = _file_version(signature_path)
+    except OSError:
+        signature_version = None
+    inputs = [RENDER_VERSION, received_by, reference_id, transaction_date, str(amount), currency, text_color,
+              asdict(encoder), config["user"]["name"], signature_path, signature_version,
+              _file_version(TEMPLATE_PATH), _file_version(FONT_PATH)]
+    return hashlib.sha256(json.dumps(inputs).encode("utf-8")).hexdigest()
+
+
+class ReceiptCache:
+    """
+    Remembers which receipt file was rendered from which inputs, so that an
+    identical request returns the existing file instead of rendering it again.
+    The index, <receipts>/.receipt-index.json, maps receipt_key() hashes to file
+    names along with the (mtime, size) each file had when written. An entry is
+    dropped when its file has since been changed, removed or overwritten by
+    another receipt, and the least recently used entries are dropped once there
+    are more than max_entries. Eviction only forgets entries: receipts belong to
+    the user and are never deleted. Lookups only reorder entries in memory; the
+    index is written when receipts are stored, which is also when entries are
+    evicted, and on close(), so a hit costs no write.
+    Attributes:
+        directory (Path): Folder holding the receipts
+        max_entries (int): Most entries kept in the index
+        hits (int): Lookups answered by an existing file
+        misses (int): Lookups that needed a render
+    Methods:
+        lookup(keys): Returns the existing receipt for each key that has one.
+        store(entries): Records receipts just written.
+        clear(): Forgets every entry.
+        close(): Writes recency and dropped entries not written yet.
+    """
+
+    def __init__(self, directory=RECEIPTS_DIR, max_entries: int = MAX_CACHE_ENTRIES) -> None:
+        self.directory = Path(directory)
+        self.index_path = self.directory / CACHE_INDEX_NAME
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._index_version: Optional[Tuple[int, int]] = None
+        # Keys used since the index was last written, least recent first
+        self._used: "OrderedDict[str, None]" = OrderedDict()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        """
+        Rereads the index if another process changed it since it was last read or written.
+        """
+        try:
+            version = _file_version(self.index_path)
+        except FileNotFoundError:
+            version = None
+        if version == self._index_version:
+            return
+        self._entries = OrderedDict()
+        if version is not None:
+            try:
+                with open(self.index_path, "r") as f:
+                    self._entries = OrderedDict(json.load(f))
+            except ValueError:
+                # A corrupt index only costs renders; it is rewritten on the next store
+                pass
+        # Keep the order of entries used here since the last write
+        for key in self._used:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        self._index_version = version
+
+    def _write(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(temp_path, self.index_path)
+        self._index_version = _file_version(self.index_path)
+        self._used = OrderedDict()
+        self._dirty = False
+
+    def _current(self, entry: dict) -> bool:
+        try:
+            return list(_file_version(self.directory / entry["name"])) == entry["version"]
+        except OSError:
+            return False
+
+    def lookup(self, keys: Iterable[str]) -> Dict[str, str]:
+        """
+        Finds the receipts already rendered for the given keys.
+
+        Args:
+            keys (Iterable[str]): Hashes from receipt_key().
+        """
+        found = {}
+        with self._lock:
+            self._refresh()
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and not self._current(entry):
+                    del self._entries[key]
+                    self._used.pop(key, None)
+                    entry = None
+                    self._dirty = True
+                if entry is None:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                self._used[key] = None
+                self._used.move_to_end(key)
+                found[key] = entry["name"]
+                self.hits += 1
+                self._dirty = True
+        return found
+
+    def get(self, key: str) -> Optional[str]:
+        return self.lookup([key]).get(key)
+
+    def store(self, entries: Dict[str, str]) -> None:
+        """
+        Records receipts that were just written.
+
+        Args:
+            entries (Dict[str, str]): Receipt file name by key.
+        """
+        if not entries:
+            return
+        with self._lock:
+            self._refresh()
+            for key, receipt_name in entries.items():
+                try:
+                    version = _file_version(self.directory / receipt_name)
+                except OSError:
+                    continue
+                self._entries[key] = {"name": receipt_name, "version": list(version)}
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._write()
+
+    def put(self, key: str, receipt_name: str) -> None:
+        self.store({key: receipt_name})
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = OrderedDict()
+            self._used = OrderedDict()
+            self._write()
+
+    def close(self) -> None:
+        """
+        Writes the index if lookups changed it since it was last written.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._refresh()
+            self._write()
+
+
+receipt_cache = ReceiptCache()
+atexit.register(receipt_cache.close)
+
+
+def render_receipt(
         received_by: str,
         reference_id: str,
         transaction_date: str,
         amount: float,
         currency: str,
         text_color: str = "black",
-):
+) -> Image.Image:
     """
-    Generates a receipt by overlaying dynamic information onto a template image (585x451).
-    Uses a default font.
+    Renders a receipt by overlaying dynamic information onto a template image (585x451).
+    The template, font and signature are decoded once and cached until their files change,
+    so each receipt only copies the base image and draws its own fields.
 
     Args:
-        filepath (str): Path to the spreadsheet file
+        received_by (str): Name of the person receiving the receipt.
         reference_id (str): The receipt reference number.
         transaction_date (str): The date of the transaction.
         amount (float): The amount paid.
         currency (str): The currency of the transaction (e.g., "USD", "AED").
         text_color (str, optional): Color of the text. Defaults to "black".
     """
-    with open(CONFIG_FILE_PATH, "r") as file:
-        data = json.load(file)
-    from_person = data["user"]["name"]
-    signature_path = data["user"]["signaturePath"]
-    try:
-        receipt_template_path = (Path(__file__).parent.parent / "assets" / "receipt_template.png").resolve() 
-        img = Image.open(receipt_template_path).convert("RGB")
-        font_path = (Path(__file__).parent.parent / 'fonts' / 'ttf' / 'JetBrainsMono-Regular.ttf').resolve()
-        font = ImageFont.truetype(font_path, size=12) 
-        draw = ImageDraw.Draw(img)
-
-        positions = {
-            "reference_id_value": (460, 77),  # After "No." label
-            "date_value": (130, 162),  # After "DATE" label
-            "from_person_value": (130, 187),  # After "FROM" (payer) label
-            "acct_paid_amount_value": (170, 302),  # Column for amount
-            "acct_paid_currency_text": (230, 302),  # Placed after the amount
-            "received_by_value": (400, 305),  # Name of receiver
-            "signature_area": (400, 330)
-        }
-
-        draw.text(positions["reference_id_value"], reference_id, fill=text_color, font=font)
-        draw.text(positions["date_value"], transaction_date, fill=text_color, font=font)
-        draw.text(positions["from_person_value"], from_person, fill=text_color, font=font)
-
-        draw.text(positions["acct_paid_amount_value"], str(amount), fill=text_color, font=font)
-        draw.text(positions["acct_paid_currency_text"], currency, fill=text_color, font=font)
-
-        draw.text(positions["received_by_value"], received_by, fill=text_color, font=font)
+    img = base_image(text_color).copy()
+    font = load_font()
+    draw = ImageDraw.Draw(img)
 
-        try:
-            signature_img = Image.open(signature_path).convert("RGBA")
-            max_sig_width = 170
-            max_sig_height = 70
-            signature_img.thumbnail((max_sig_width, max_sig_height))
-
-            paste_x = positions["signature_area"][0]
-            paste_y = positions["signature_area"][1]
-            img.paste(signature_img, (paste_x, paste_y), signature_img)
-        except FileNotFoundError:
-            print(f"Warning: Signature file not found at {signature_path}")
-        except Exception as e:
-            print(f"Warning: Could not process signature image: {e}")
+    draw.text(POSITIONS["reference_id_value"], reference_id, fill=text_color, font=font)
+    draw.text(POSITIONS["date_value"], transaction_date, fill=text_color, font=font)
+
+    draw.text(POSITIONS["acct_paid_amount_value"], str(amount), fill=text_color, font=font)
+    draw.text(POSITIONS["acct_paid_currency_text"], currency, fill=text_color, font=font)
 
-        receipt_name = f"{received_by}{reference_id}.png"
-        output_path = (Path(__file__).parent.parent / "receipts" / receipt_name).resolve()
+    draw.text(POSITIONS["received_by_value"], received_by, fill=text_color, font=font)
+    return img
+
+
+def render_receipt_bytes(
+        received_by: str,
+        reference_id: str,
+        transaction_date: str,
+        amount: float,
+        currency: str,
+        text_color: str = "black",
+        encoder: Optional[Encoder] = None,
+) -> EncodedReceipt:
+    """
+    Renders and encodes a receipt in memory, without touching the receipts folder,
+    e.g. for a preview or an HTTP response.
+
+    Args:
+        received_by (str): Name of the person receiving the receipt.
+        reference_id (str): The receipt reference number.
+        transaction_date (str): The date of the transaction.
+        amount (float): The amount paid.
+        currency (str): The currency of the transaction (e.g., "USD", "AED").
+        text_color (str, optional): Color of the text. Defaults to "black".
+        encoder (Encoder, optional): Defaults to the encoder set in config.json.
+    """
+    img = render_receipt(received_by, reference_id, transaction_date, amount, currency, text_color)
+    return (encoder or configured_encoder()).encode(img)
+
+
+def _save_receipt(received_by: str, reference_id: str, transaction_date: str, amount: float, currency: str,
+                  text_color: str = "black", encoder: Optional[Encoder] = None,
+                  cache: Optional[ReceiptCache] = None) -> Optional[Tuple[str, Optional[EncodedReceipt]]]:
+    """
+    Renders and writes a receipt unless the cache holds an identical one.
+    Returns the file name and how it was encoded, which is None for a cached receipt.
+    """
+    try:
+        encoder = encoder or configured_encoder()
+        key = None
+        if cache is not None:
+            key = receipt_key(received_by, reference_id, transaction_date, amount, currency, text_color, encoder)
+            receipt_name = cache.get(key)
+            if receipt_name is not None:
+                return receipt_name, None
+        encoded = render_receipt_bytes(received_by, reference_id, transaction_date, amount, currency,
+                                       text_color, encoder)
+        receipt_name = f"{received_by}{reference_id}{encoder.extension}"
+        output_path = RECEIPTS_DIR / receipt_name
         output_path.parent.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
-        img.save(output_path)
-        return receipt_name
+        output_path.write_bytes(encoded.data)
+        if cache is not None:
+            cache.put(key, receipt_name)
+        return receipt_name, encoded
 
     except FileNotFoundError as e:
-        print(f"Error: Template file not found at {receipt_template_path}. Exception: {e}")
+        print(f"Error: Template file not found at {TEMPLATE_PATH}. Exception: {e}")
     except Exception as e:
-        print(f"An error occurred: {e}")
\ No newline at end of file
+        print(f"An error occurred: {e}")
+
+
+def generate_receipt(
+        received_by: str,
+        reference_id: str,
+        transaction_date: str,
+        amount: float,
+        currency: str,
+        text_color: str = "black",
+        encoder: Optional[Encoder] = None,
+        use_cache: bool = True,
+):
+    """
+    Renders a receipt and writes it to the receipts folder. If an identical
+    receipt was already written and is unchanged, its name is returned at once.
+
+    Args:
+        received_by (str): Name of the person receiving the receipt.
+        reference_id (str): The receipt reference number.
+        transaction_date (str): The date of the transaction.
+        amount (float): The amount paid.
+        currency (str): The currency of the transaction (e.g., "USD", "AED").
+        text_color (str, optional): Color of the text. Defaults to "black".
+        encoder (Encoder, optional): Defaults to the encoder set in config.json.
+        use_cache (bool, optional): Reuse identical receipts. Defaults to True.
+    """
+    saved = _save_receipt(received_by, reference_id, transaction_date, amount, currency, text_color, encoder,
+                          receipt_cache if use_cache else None)
+    return saved[0] if saved else None
+
+
+def _receipt_fields(transaction, received_by: str) -> dict:
+    return dict(received_by=str(received_by),
+                reference_id=str(transaction.reference_id),
+                transaction_date=str(transaction.transaction_date),
+                amount=transaction.amount,
+                currency=str(transaction.currency))
+
+
+def generate_receipt_for(transaction, received_by: str, text_color: str = "black",
+                         encoder: Optional[Encoder] = None, use_cache: bool = True):
+    """
+    Generates a receipt for a transaction.
+
+    Args:
+        transaction (Transaction): The transaction to generate a receipt for.
+        received_by (str): Name of the person receiving the receipt.
+        text_color (str, optional): Color of the text. Defaults to "black".
+        encoder (Encoder, optional): Defaults to the encoder set in config.json.
+        use_cache (bool, optional): Reuse identical receipts. Defaults to True.
+    """
+    return generate_receipt(**_receipt_fields(transaction, received_by), text_color=text_color, encoder=encoder,
+                            use_cache=use_cache)
+
+
+@dataclass
+class BatchReport:
+    """
+    Outcome of a batch of receipts.
+    Attributes:
+        generated (list): File names of the receipts written
+        failed (list): Reference IDs whose receipt could not be rendered
+        missing (list): Requested reference IDs that matched no transaction
+        cached (int): Receipts reused from an identical earlier render
+        cancelled (bool): Whether the batch was stopped before every receipt was generated
+        seconds (float): Time spent rendering
+        encode_seconds (float): Time spent encoding, summed over every worker
+        bytes_written (int): Total size of the receipts written
+    """
+    generated: List[str] = field(default_factory=list)
+    failed: List[Any] = field(default_factory=list)
+    missing: List[Any] = field(default_factory=list)
+    cached: int = 0
+    cancelled: bool = False
+    seconds: float = 0.0
+    encode_seconds: float = 0.0
+    bytes_written: int = 0
+
+    @property
+    def receipts_per_second(self) -> float:
+        return len(self.generated) / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (f"Generated {len(self.generated)} receipts in {self.seconds:.2f}s "
+                f"({self.receipts_per_second:.1f} receipts/s, {self.bytes_written / 1024:.0f} KB, "
+                f"{self.encode_seconds:.2f}s encoding), {self.cached} reused, {len(self.failed)} failed")
+
+
+def _render_chunk(transactions: List[tuple], received_by: str, text_color: str,
+                  encoder: Optional[Encoder]) -> List[Tuple[Any, Optional[Tuple[str, int, float]]]]:
+    results = []
+    for transaction in transactions:
+        saved = _save_receipt(**_receipt_fields(transaction, received_by), text_color=text_color, encoder=encoder)
+        # Only the statistics cross back to the parent process, not the image bytes
+        results.append((transaction.reference_id, (saved[0], saved[1].size, saved[1].seconds) if saved else None))
+    return results
+
+
+def generate_receipts(transactions: Iterable[Any], received_by: str, text_color: str = "black",
+                      encoder: Optional[Encoder] = None, max_workers: Optional[int] = None,
+                      progress: Optional[Callable[[int, int], None]] = None, use_cache: bool = True,
+                      cancelled: Optional[threading.Event] = None) -> BatchReport:
+    """
+    Generates a receipt for each transaction, spread over a pool of processes.
+    Transactions sharing a reference ID would share a file name, so only the
+    first of them gets a receipt. Receipts already rendered from identical
+    inputs are reused without starting a worker.
+
+    Args:
+        transactions (Iterable[Transaction]): The transactions to generate receipts for.
+        received_by (str): Name of the person receiving the receipts.
+        text_color (str, optional): Color of the text. Defaults to "black".
+        encoder (Encoder, optional): Defaults to the encoder set in config.json.
+        max_workers (int, optional): Number of processes. Defaults to the number of cores.
+        progress (Callable, optional): Called with (receipts done, total) as chunks complete.
+        use_cache (bool, optional): Reuse identical receipts. Defaults to True.
+        cancelled (Event, optional): Stops the batch once set. Receipts already written are kept.
+    """
+    start = time.perf_counter()
+    report = BatchReport()
+    unique, seen = [], set()
+    for transaction in transactions:
+        if transaction.reference_id not in seen:
+            seen.add(transaction.reference_id)
+            unique.append(transaction)
+    total = len(unique)
+    max_workers = max_workers or os.cpu_count() or 1
+    encoder = encoder or configured_encoder()
+
+    keys = {}
+    if use_cache:
+        keys = {transaction.reference_id: receipt_key(**_receipt_fields(transaction, received_by),
+                                                      text_color=text_color, encoder=encoder)
+                for transaction in unique}
+        found = receipt_cache.lookup(keys.values())
+        report.generated = [found[keys[transaction.reference_id]] for transaction in unique
+                            if keys[transaction.reference_id] in found]
+        report.cached = len(report.generated)
+        unique = [transaction for transaction in unique if keys[transaction.reference_id] not in found]
+
+    def record(results: List[Tuple[Any, Optional[Tuple[str, int, float]]]]) -> None:
+        written = {}
+        for reference_id, saved in results:
+            if saved:
+                receipt_name, size, encode_seconds = saved
+                report.generated.append(receipt_name)
+                report.bytes_written += size
+                report.encode_seconds += encode_seconds
+                if reference_id in keys:
+                    written[keys[reference_id]] = receipt_name
+            else:
+                report.failed.append(reference_id)
+        receipt_cache.store(written)
+        if progress is not None:
+            progress(len(report.generated) + len(report.failed), total)
+
+    def stopped() -> bool:
+        report.cancelled = cancelled is not None and cancelled.is_set()
+        return report.cancelled
+
+    if len(unique) < PARALLEL_THRESHOLD or max_workers == 1:
+        for transaction in unique:
+            if stopped():
+                break
+            record(_render_chunk([transaction], received_by, text_color, encoder))
+    else:
+        chunk_size = max(1, min(MAX_CHUNK_SIZE, len(unique) // (max_workers * 4)))
+        # Spawned workers do not inherit the caller's threads, e.g. those of a GUI
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(_render_chunk, unique[i:i + chunk_size], received_by, text_color, encoder)
+                       for i in range(0, len(unique), chunk_size)]
+            for future in as_completed(futures):
+                record(future.result())
+                if stopped():
+                    # Chunks already running finish, the rest never start
+                    for pending in futures:
+                        pending.cancel()
+                    break
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+class _PdfWriter:
+    """
+    Writes a PDF whose pages are each one full-page JPEG image, streaming every
+    page to disk as it is added. Only the byte offsets of the objects written
+    are kept in memory, so the cost of a page does not depend on how many came before.
+    """
+    CATALOG = 1
+    PAGES = 2
+
+    def __init__(self, file: BinaryIO) -> None:
+        self.file = file
+        self.offsets: Dict[int, int] = {}
+        self.pages: List[int] = []
+        self.next_object = 3
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._write_object(self.CATALOG, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    def _allocate(self) -> int:
+        number = self.next_object
+        self.next_object += 1
+        return number
+
+    def _write_object(self, number: int, body: bytes, stream: Optional[bytes] = None) -> None:
+        self.offsets[number] = self.file.tell()
+        self.file.write(f"{number} 0 obj\n".encode("ascii") + body)
+        if stream is not None:
+            self.file.write(b"\nstream\n" + stream + b"\nendstream")
+        self.file.write(b"\nendobj\n")
+
+    def add_page(self, img: Image.Image, quality: int = STATEMENT_QUALITY, first: bool = False) -> None:
+        """
+        Adds a page the size of the image, one point per pixel.
+
+        Args:
+            img (Image): The page.
+            quality (int, optional): JPEG quality.
+            first (bool, optional): Place the page before every other page.
+        """
+        buffer = io.BytesIO()
+        img.convert("RGB").save(buffer, "JPEG", quality=quality)
+        data = buffer.getvalue()
+        width, height = img.size
+        image, content, page = self._allocate(), self._allocate(), self._allocate()
+        self._write_object(image, (f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                                   f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode "
+                                   f"/Length {len(data)} >>").encode("ascii"), data)
+        drawing = f"q {width} 0 0 {height} 0 0 cm /Im0 Do Q".encode("ascii")
+        self._write_object(content, f"<< /Length {len(drawing)} >>".encode("ascii"), drawing)
+        self._write_object(page, (f"<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {width} {height}] "
+                                  f"/Resources << /XObject << /Im0 {image} 0 R >> >> "
+                                  f"/Contents {content} 0 R >>").encode("ascii"))
+        if first:
+            self.pages.insert(0, page)
+        else:
+            self.pages.append(page)
+
+    def close(self) -> None:
+        kids = " ".join(f"{page} 0 R" for page in self.pages)
+        self._write_object(self.PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode("ascii"))
+        xref = self.file.tell()
+        self.file.write(f"xref\n0 {self.next_object}\n0000000000 65535 f \n".encode("ascii"))
+        for number in range(1, self.next_object):
+            self.file.write(f"{self.offsets[number]:010d} 00000 n \n".encode("ascii"))
+        self.file.write(f"trailer\n<< /Size {self.next_object} /Root {self.CATALOG} 0 R >>\n"
+                        f"startxref\n{xref}\n%%EOF\n".encode("ascii"))
+
+
+@dataclass
+class StatementSummary:
+    """
+    Running totals of the transactions on a statement.
+    Attributes:
+        receipts (int): Receipt pages written
+        cancelled (bool): Whether the export was stopped, in which case no file was written
+        totals (dict): Sum of amounts per currency
+        first_date (date): Earliest transaction date
+        last_date (date): Latest transaction date
+    """
+    receipts: int = 0
+    cancelled: bool = False
+    totals: Dict[str, float] = field(default_factory=dict)
+    first_date: Any = None
+    last_date: Any = None
+
+    def add(self, transaction) -> None:
+        self.receipts += 1
+        try:
+            amount = float(transaction.amount)
+        except (TypeError, ValueError):
+            amount = None
+        if amount is not None:
+            currency = str(transaction.currency).upper()
+            self.totals[currency] = self.totals.get(currency, 0.0) + amount
+        transaction_date = parse_date(transaction.transaction_date)
+        if transaction_date is not None:
+            self.first_date = min(self.first_date or transaction_date, transaction_date)
+            self.last_date = max(self.last_date or transaction_date, transaction_date)
+
+
+def render_summary(summary: StatementSummary, received_by: str, text_color: str = "black") -> Image.Image:
+    """
+    Renders a statement's summary page, the size of a receipt.
+
+    Args:
+        summary (StatementSummary): Totals of the statement.
+        received_by (str): Name of the person receiving the statement.
+        text_color (str, optional): Color of the text. Defaults to "black".
+    """
+    img = Image.new("RGB", load_template().size, "white")
+    draw = ImageDraw.Draw(img)
+    font = load_font()
+    title_font = _cached("title_font", _file_version(FONT_PATH),
+                         lambda: ImageFont.truetype(FONT_PATH, size=FONT_SIZE * 2))
+    period = (f"{summary.first_date.isoformat()} to {summary.last_date.isoformat()}"
+              if summary.first_date else "No dated transactions")
+    lines = [f"From: {load_config()['user']['name']}",
+             f"Received by: {received_by}",
+             f"Period: {period}",
+             f"Receipts: {summary.receipts}",
+             "",
+             "Totals:"]
+    currencies = sorted(summary.totals)
+    lines += [f"  {summary.totals[currency]:>16,.2f} {currency}" for currency in currencies[:MAX_SUMMARY_CURRENCIES]]
+    if len(currencies) > MAX_SUMMARY_CURRENCIES:
+        lines.append(f"  and {len(currencies) - MAX_SUMMARY_CURRENCIES} more currencies")
+    draw.text((40, 30), "Statement", fill=text_color, font=title_font)
+    for i, line in enumerate(lines):
+        draw.text((40, 80 + i * 20), line, fill=text_color, font=font)
+    return img
+
+
+def export_statement(transactions: Iterable[Any], output_path, received_by: str, text_color: str = "black",
+                     summary: bool = True, quality: int = STATEMENT_QUALITY,
+                     progress: Optional[Callable[[int], None]] = None,
+                     cancelled: Optional[threading.Event] = None) -> StatementSummary:
+    """
+    Writes one PDF statement with a receipt per page, rendering pages one at a
+    time as the transactions are consumed, so memory use stays flat however
+    many pages there are. The optional summary page comes first.
+
+    Args:
+        transactions (Iterable[Transaction]): The transactions, e.g. from LedgerReader.iter_transactions().
+        output_path (str): Where to write the PDF.
+        received_by (str): Name of the person receiving the statement.
+        text_color (str, optional): Color of the text. Defaults to "black".
+        summary (bool, optional): Add a summary page. Defaults to True.
+        quality (int, optional): JPEG quality of the pages.
+        progress (Callable, optional): Called with the number of receipt pages written so far.
+        cancelled (Event, optional): Stops the export once set, leaving no file behind.
+    """
+    totals = StatementSummary()
+    temp_path = f"{os.fspath(output_path)}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            writer = _PdfWriter(file)
+            for transaction in transactions:
+                if cancelled is not None and cancelled.is_set():
+                    totals.cancelled = True
+                    return totals
+                img = render_receipt(**_receipt_fields(transaction, received_by), text_color=text_color)
+                writer.add_page(img, quality)
+                totals.add(transaction)
+                if progress is not None:
+                    progress(totals.receipts)
+            if summary:
+                writer.add_page(render_summary(totals, str(received_by), text_color), quality, first=True)
+            writer.close()
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return totals
@@ -0,0 +1,265 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+from core.books import JOURNAL_SUFFIX, ExcelManager, LedgerObserver, file_signature, parse_date, reference_key
+from core.transaction import FIELDS, Transaction
+
+SIDECAR_SUFFIX = ".sqlite"
+# Bumped whenever SCHEMA changes; an index with another version is rebuilt
+SCHEMA_VERSION = 2
+# Bytes read at a time when hashing a workbook
+HASH_CHUNK_SIZE = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    row INTEGER NOT NULL,
+    amount,
+    currency,
+    conversion_rate,
+    transaction_date,
+    reference_id,
+    reference_key TEXT,
+    currency_key TEXT,
+    date_key TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_reference_key ON transactions (reference_key);
+CREATE INDEX IF NOT EXISTS transactions_date_key ON transactions (date_key);
+CREATE INDEX IF NOT EXISTS transactions_currency_key ON transactions (currency_key);
+CREATE INDEX IF NOT EXISTS transactions_row ON transactions (row);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+"""
+COLUMNS = ", ".join(FIELDS)
+INSERT = f"INSERT INTO transactions (row, {COLUMNS}, reference_key, currency_key, date_key) " \
+         f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def _storable(value: Any) -> Any:
+    """
+    Converts a cell value to one SQLite can store. Dates become ISO text.
+    """
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _record(row_number: int, transaction: Transaction) -> tuple:
+    parsed = parse_date(transaction.transaction_date)
+    currency = transaction.currency
+    return (row_number, *map(_storable, transaction),
+            reference_key(transaction.reference_id),
+            str(currency).upper() if currency is not None else None,
+            parsed.isoformat() if parsed else None)
+
+
+def file_hash(filepath) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _journal_size(journal_path) -> int:
+    try:
+        return os.path.getsize(journal_path)
+    except FileNotFoundError:
+        return 0
+
+
+class SqliteIndex(LedgerObserver):
+    """
+    A SQLite copy of a ledger kept next to its workbook as <workbook>.sqlite.
+    Rows are indexed by reference ID, as normalised by reference_key(), date and
+    currency, so lookups and range queries stay fast however large the ledger
+    grows, without parsing the xlsx.
+    Attached to an ExcelManager, the index follows every add and delete in the
+    same call, and commits whenever the workbook (and journal, if any) on disk
+    hold the same rows. It records their size and modification time when it
+    does, and is rebuilt from the workbook when attached to one that no longer
+    matches. The workbook is only hashed by is_current(), never on a write.
+    The workbook stays the source of truth: values SQLite cannot hold, such as
+    dates, are stored as text.
+    Attributes:
+        filepath (str): Path to the workbook
+        path (str): Path to the SQLite file
+    Methods:
+        attach(manager): Syncs the index with a workbook and follows its writes.
+        is_current(): Checks the index against the workbook on disk.
+        rebuild(rows): Replaces the indexed rows.
+        find_by_reference(reference_id): Returns a transaction by its reference ID.
+        query(currency, start, end): Returns the transactions matching every filter.
+    """
+
+    def __init__(self, filepath, manager: Optional[ExcelManager] = None) -> None:
+        """
+        Opens the index of a workbook, creating it if needed.
+        :param filepath: Path to the workbook
+        :param manager: ExcelManager of the workbook to attach to
+        """
+        self.filepath = os.fspath(filepath)
+        self.path = f"{self.filepath}{SIDECAR_SUFFIX}"
+        self.journal_path = f"{self.filepath}{JOURNAL_SUFFIX}"
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.connection.executescript("DROP TABLE IF EXISTS transactions; DROP TABLE IF EXISTS meta;")
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.connection.executescript(SCHEMA)
+        self.rebuilds = 0
+        if manager is not None:
+            self.attach(manager)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    def __contains__(self, reference_id: Any) -> bool:
+        return self.find_row(reference_id) is not None
+
+    def _meta(self) -> Dict[str, Any]:
+        return dict(self.connection.execute("SELECT key, value FROM meta"))
+
+    def _set_meta(self, **values: Any) -> None:
+        self.connection.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", values.items())
+
+    def is_current(self) -> bool:
+        """
+        Checks whether the index holds the rows of the workbook and journal on disk.
+        Falls back to comparing hashes when only the modification time differs,
+        e.g. after the workbook was copied. The hash of a matching workbook is
+        recorded the first time it is checked, as writes do not hash it.
+        :return: True if the index can be used as it is
+        """
+        with self._lock:
+            meta = self._meta()
+            try:
+                mtime_ns, size = file_signature(self.filepath)
+            except FileNotFoundError:
+                return False
+            if meta.get("size") != size or meta.get("journal_size") != _journal_size(self.journal_path):
+                return False
+            if meta.get("mtime_ns") == mtime_ns:
+                if meta.get("sha256") is None:
+                    self._set_meta(sha256=file_hash(self.filepath))
+                    self.connection.commit()
+                return True
+            if meta.get("sha256") is None or meta.get("sha256") != file_hash(self.filepath):
+                return False
+            self._set_meta(mtime_ns=mtime_ns)
+            self.connection.commit()
+            return True
+
+    def attach(self, manager: ExcelManager) -> None:
+        """
+        Rebuilds the index unless it matches the workbook, then follows the manager's writes.
+        :param manager:
+        :return: None
+        """
+        with self._lock:
+            # Writes not saved yet are in neither the workbook nor the journal
+            if (manager.pending_writes and not manager.journal) or not self.is_current():
+                self.rebuild(manager.iter_rows())
+                self.on_commit(manager)
+                # Records the hash of the workbook the index was rebuilt from
+                self.is_current()
+            else:
+                self.on_commit(manager)
+        manager.add_observer(self)
+
+    def rebuild(self, rows) -> None:
+        """
+        Replaces the indexed rows, leaving the change uncommitted.
+        :param rows: (row number, Transaction) pairs
+        :return: None
+        """
+        with self._lock:
+            self.connection.execute("DELETE FROM transactions")
+            self.connection.execute("DELETE FROM meta")
+            self.connection.executemany(INSERT, (_record(row_number, transaction)
+                                                 for row_number, transaction in rows))
+            self.rebuilds += 1
+
+    def on_add(self, manager: ExcelManager, row_number: int, transaction: Transaction) -> None:
+        with self._lock:
+            self.connection.execute(INSERT, _record(row_number, transaction))
+
+    def on_delete(self, manager: ExcelManager, row_number: int, shifted: bool) -> None:
+        with self._lock:
+            self.connection.execute("DELETE FROM transactions WHERE row = ?", (row_number,))
+            if shifted:
+                self.connection.execute("UPDATE transactions SET row = row - 1 WHERE row > ?", (row_number,))
+
+    def on_reset(self, manager: ExcelManager) -> None:
+        self.rebuild(manager.iter_rows())
+
+    def on_commit(self, manager: ExcelManager) -> None:
+        """
+        Commits the index once the workbook and journal on disk hold every write,
+        together with their fingerprint. Until then the index keeps its last
+        committed state, so a crash leaves it matching what is on disk.
+        """
+        if manager.pending_writes and not manager.journal:
+            return
+        with self._lock:
+            mtime_ns, size = manager.disk_signature or file_signature(self.filepath)
+            meta = self._meta()
+            # A rewritten workbook is hashed by the next is_current() instead of here
+            sha256 = meta.get("sha256") if (meta.get("mtime_ns"), meta.get("size")) == (mtime_ns, size) else None
+            self._set_meta(mtime_ns=mtime_ns, size=size, sha256=sha256,
+                           journal_size=_journal_size(self.journal_path))
+            self.connection.commit()
+
+    def find_row(self, reference_id: Any) -> Optional[int]:
+        with self._lock:
+            found = self.connection.execute(
+                "SELECT MIN(row) FROM transactions WHERE reference_key = ?", (reference_key(reference_id),)).fetchone()
+        return found[0]
+
+    def find_by_reference(self, reference_id: Any) -> Optional[Transaction]:
+        """
+        Looks up the first transaction with a given reference ID.
+        :param reference_id:
+        :return: Transaction or None if no such transaction exists
+        """
+        with self._lock:
+            found = self.connection.execute(
+                f"SELECT {COLUMNS} FROM transactions WHERE reference_key = ? ORDER BY row LIMIT 1",
+                (reference_key(reference_id),)).fetchone()
+        return Transaction._make(found) if found else None
+
+    def query(self, currency: Optional[str] = None, start: Any = None, end: Any = None) -> List[Transaction]:
+        """
+        Returns the transactions matching every given filter, in worksheet order.
+        :param currency: Currency code, case insensitive
+        :param start: First transaction date to include, as a date or text
+        :param end: Last transaction date to include, as a date or text
+        :return: List of Transaction
+        """
+        conditions, parameters = [], []
+        if currency:
+            conditions.append("currency_key = ?")
+            parameters.append(currency.upper())
+        for bound, operator in ((start, ">="), (end, "<=")):
+            if bound is None:
+                continue
+            parsed = parse_date(bound)
+            if parsed is None:
+                raise ValueError(f"{bound!r} is not a recognisable date")
+            conditions.append(f"date_key {operator} ?")
+            parameters.append(parsed.isoformat())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self.connection.execute(
+                f"SELECT {COLUMNS} FROM transactions {where} ORDER BY row", parameters).fetchall()
+        return [Transaction._make(row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
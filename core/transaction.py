@@ -0,0 +1,70 @@
+from datetime import date, datetime
+from typing import Any, NamedTuple, Optional, Sequence
+
+# Formats tried, in order, for transaction dates stored as text
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y')
+
+
+class Transaction(NamedTuple):
+    """
+    An immutable ledger transaction, one worksheet row.
+    Being a tuple with no per-instance __dict__, a Transaction costs no more
+    memory than the row it holds, and converts to and from rows without copying
+    field by field.
+    Attributes:
+        amount (float): The amount paid
+        currency (str): Currency code, e.g. "USD"
+        conversion_rate (float): Rate used to convert the amount
+        transaction_date (str): Date of the transaction
+        reference_id (str): Reference ID of the transaction
+    Methods:
+        from_row(row): Builds a transaction from worksheet values.
+        to_row(): Returns the worksheet values of the transaction.
+    """
+    amount: Any
+    currency: Any
+    conversion_rate: Any
+    transaction_date: Any
+    reference_id: Any
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> "Transaction":
+        """
+        Builds a transaction from the first five values of a worksheet row.
+        Missing trailing values are read as None.
+        :param row:
+        :return: Transaction
+        """
+        if len(row) < len(cls._fields):
+            row = tuple(row) + (None,) * (len(cls._fields) - len(row))
+        return cls._make(row[:len(cls._fields)])
+
+    def to_row(self) -> list:
+        return list(self)
+
+
+FIELDS = Transaction._fields
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """
+    Parses a transaction date as written by Excel, Duckling or a user.
+    :param value: date, datetime or text such as "2025-06-10T00:00:00.000-07:00" or "05/10/2024"
+    :return: date or None if the value is not a recognisable date
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    # ISO timestamps, e.g. from Duckling, carry the date in their first ten characters
+    candidates = (value, value[:10]) if len(value) > 10 and value[10] in "T " else (value,)
+    for candidate in candidates:
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, date_format).date()
+            except ValueError:
+                continue
+    return None
@@ -0,0 +1,30 @@
+import pytest
+import tempfile
+import shutil
+from pathlib import Path
+
+FILE_NAME = 'TestBook.xlsx'
+ORIGINAL_FILE = (Path(__file__).parent.parent / 'sheet_data' / FILE_NAME).resolve()
+
+
+@pytest.fixture
+def temp_dir():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield Path(temp_dir)
+
+
+@pytest.fixture
+def temp_path(temp_dir):
+    temp_path = temp_dir / FILE_NAME
+    shutil.copy(ORIGINAL_FILE, temp_path)
+    return temp_path
+
+
+@pytest.fixture
+def temp_paths(temp_dir):
+    paths = []
+    for i in range(3):
+        temp_path = temp_dir / f"{i}{FILE_NAME}"
+        shutil.copy(ORIGINAL_FILE, temp_path)
+        paths.append(temp_path)
+    return paths
@@ -1,8 +1,16 @@
+import gc
 import pytest
 import tempfile
 import shutil
+import threading
 from pathlib import Path
-from core.books import ExcelManager
+from zipfile import ZipFile
+from openpyxl import load_workbook
+from openpyxl.styles import Font
+from datetime import date
+from core import receipt
+from core.books import ExcelManager, LedgerReader, _PENDING_MANAGERS, _flush_pending_managers, file_signature
+from core.transaction import Transaction
 
 FILE_NAME = 'TestBook.xlsx'
 ORIGINAL_FILE = (Path(__file__).parent.parent / 'sheet_data' / FILE_NAME).resolve()
@@ -79,3 +87,427 @@ def test_delete_transaction_2(temp_client):
     non_existent_ref = "This transaction wouldn't exist"
     transaction_deleted = temp_client.delete_transaction(reference_id=non_existent_ref)
     assert not transaction_deleted
+
+
+def test_find_by_reference_1(temp_client):
+    temp_client.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                                transaction_date="05/10/2024", reference_id="2431")
+    temp_client.add_transaction(amount=20.0, currency="AED", conversion_rate=1.0,
+                                transaction_date="06/10/2024", reference_id="2432")
+
+    assert temp_client.find_by_reference("2432") == (20.0, "AED", 1.0, "06/10/2024", "2432")
+    assert temp_client.find_by_reference("missing") is None
+
+
+def test_find_by_reference_2(temp_client):
+    for reference_id in ["1", "2", "3"]:
+        temp_client.add_transaction(amount=1.0, currency="USD", conversion_rate=1.0,
+                                    transaction_date="05/10/2024", reference_id=reference_id)
+
+    assert temp_client.delete_transaction(reference_id="1")
+    assert temp_client.find_by_reference("1") is None
+    # Rows below the deleted transaction move up, and so must the index
+    assert temp_client.find_row("3") == 3
+    assert temp_client.find_by_reference("3")[4] == "3"
+
+
+def test_batch_1(temp_client):
+    with temp_client.batch():
+        for reference_id in ["1", "2", "3"]:
+            temp_client.add_transaction(amount=1.0, currency="USD", conversion_rate=1.0,
+                                        transaction_date="05/10/2024", reference_id=reference_id)
+        temp_client.delete_transaction(reference_id="2")
+        assert temp_client.pending_writes == 4
+        # Nothing reaches the file until the batch exits
+        assert ExcelManager(temp_client.filepath).ws.max_row == 1
+
+    assert temp_client.pending_writes == 0
+    reloaded = ExcelManager(temp_client.filepath)
+    assert reloaded.find_row("1") == 2
+    assert reloaded.find_row("3") == 3
+    assert reloaded.find_row("2") is None
+
+
+def test_batch_2(temp_client):
+    with temp_client.batch(flush_every=2):
+        for reference_id in ["1", "2", "3"]:
+            temp_client.add_transaction(amount=1.0, currency="USD", conversion_rate=1.0,
+                                        transaction_date="05/10/2024", reference_id=reference_id)
+        assert temp_client.pending_writes == 1
+        assert ExcelManager(temp_client.filepath).ws.max_row == 3
+
+
+def test_journal_1(temp_client):
+    client = ExcelManager(temp_client.filepath, journal=True)
+    client.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                           transaction_date="05/10/2024", reference_id="2431")
+    client.add_transaction(amount=20.0, currency="AED", conversion_rate=1.0,
+                           transaction_date="06/10/2024", reference_id="2432")
+    client.delete_transaction(reference_id="2431")
+
+    # Writes only reach the journal, the workbook itself is untouched
+    assert Path(client.journal_path).stat().st_size > 0
+    assert not client.is_stale()
+
+    # Reopening replays the journal
+    reopened = ExcelManager(temp_client.filepath, journal=True)
+    assert reopened.find_by_reference("2432") == (20.0, "AED", 1.0, "06/10/2024", "2432")
+    assert reopened.find_row("2431") is None
+
+
+def test_journal_2(temp_client):
+    client = ExcelManager(temp_client.filepath, journal=True)
+    client.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                           transaction_date="05/10/2024", reference_id="2431")
+    journal = Path(client.journal_path).read_text()
+    client.flush()
+    assert Path(client.journal_path).stat().st_size == 0
+
+    # A crash between saving and truncating leaves folded entries in the journal
+    Path(client.journal_path).write_text(journal)
+    reopened = ExcelManager(temp_client.filepath, journal=True)
+    assert reopened.ws.max_row == 2
+
+
+def test_journal_3(temp_client):
+    # A manager dropped with batched writes still saves them at exit
+    client = ExcelManager(temp_client.filepath)
+    client.batch().__enter__()
+    client.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                           transaction_date="05/10/2024", reference_id="2431")
+    del client
+    gc.collect()
+
+    _flush_pending_managers()
+    assert load_workbook(temp_client.filepath).active.cell(row=2, column=5).value == "2431"
+
+
+def test_journal_4(temp_client):
+    # A manager whose file changed on disk, e.g. replaced in a WorkbookPool, is not saved over it
+    stale = ExcelManager(temp_client.filepath)
+    stale.batch().__enter__()
+    stale.add_transaction(amount=1.0, currency="USD", conversion_rate=1.0,
+                          transaction_date="05/10/2024", reference_id="1")
+    temp_client.add_transaction(amount=2.0, currency="USD", conversion_rate=1.0,
+                                transaction_date="05/10/2024", reference_id="2")
+    # Journal writes are durable already and need no flush at exit
+    journaling = ExcelManager(temp_client.filepath, journal=True)
+    journaling.add_transaction(amount=3.0, currency="USD", conversion_rate=1.0,
+                               transaction_date="05/10/2024", reference_id="3")
+    assert journaling not in _PENDING_MANAGERS
+
+    _flush_pending_managers()
+    assert stale not in _PENDING_MANAGERS
+    assert [t.reference_id for _, t in ExcelManager(temp_client.filepath).iter_rows()] == ["2"]
+    assert [t.reference_id for _, t in ExcelManager(temp_client.filepath, journal=True).iter_rows()] == ["2", "3"]
+
+
+def test_tombstone_1(temp_client):
+    client = ExcelManager(temp_client.filepath, tombstone_deletes=True)
+    for reference_id in ["1", "2", "3"]:
+        client.add_transaction(amount=1.0, currency="USD", conversion_rate=1.0,
+                               transaction_date="05/10/2024", reference_id=reference_id)
+
+    assert client.delete_transaction(reference_id="2")
+    assert not client.delete_transaction(reference_id="2")
+    # The row stays in place, hidden, until compaction
+    assert client.ws.cell(row=3, column=5).value == "2"
+    assert client.find_by_reference("2") is None
+    assert client.find_row("3") == 4
+
+    reopened = ExcelManager(temp_client.filepath, tombstone_deletes=True)
+    assert reopened.tombstones == {3}
+    assert reopened.find_by_reference("2") is None
+
+
+def test_tombstone_2(temp_client):
+    client = ExcelManager(temp_client.filepath, tombstone_deletes=True)
+    for reference_id in ["1", "2", "3", "4"]:
+        client.add_transaction(amount=1.0, currency="USD", conversion_rate=1.0,
+                               transaction_date="05/10/2024", reference_id=reference_id)
+    client.delete_transaction(reference_id="2")
+    client.delete_transaction(reference_id="4")
+
+    assert client.compact() == 2
+    assert client.ws.max_row == 3
+    assert [client.ws.cell(row=row, column=5).value for row in (2, 3)] == ["1", "3"]
+    assert client.find_row("3") == 3
+    assert not client.tombstones
+
+
+def test_tombstone_3(temp_client):
+    # Columns beyond the ledger's move with their transaction
+    plain = temp_client
+    tombstoned = ExcelManager(temp_client.filepath, tombstone_deletes=True)
+    for client in (plain, tombstoned):
+        for reference_id in ["1", "2", "3", "4", "5"]:
+            client.add_transaction(amount=1.0, currency="USD", conversion_rate=1.0,
+                                   transaction_date="05/10/2024", reference_id=reference_id)
+            client.ws.cell(row=client.ws.max_row, column=7).value = f"note{reference_id}"
+        for reference_id in ["2", "3", "5"]:
+            client.delete_transaction(reference_id=reference_id)
+    tombstoned.compact()
+
+    sheets = [[row for row in client.ws.iter_rows(values_only=True)] for client in (plain, tombstoned)]
+    assert sheets[0] == sheets[1]
+    assert [row[4:] for row in sheets[1][1:]] == [("1", None, "note1"), ("4", None, "note4")]
+
+
+def test_tombstone_4(temp_client):
+    # A row hidden by hand in Excel is not a tombstone
+    temp_client.add_transactions([(1.0, "USD", 1.0, "05/10/2024", reference_id) for reference_id in "123"])
+    temp_client.ws.row_dimensions[3].hidden = True
+    temp_client.save()
+
+    client = ExcelManager(temp_client.filepath, tombstone_deletes=True)
+    assert not client.tombstones
+    assert client.find_by_reference("2") is not None
+    client.delete_transaction(reference_id="3")
+    # Deleting without tombstones moves the tombstones below the deleted row
+    plain = ExcelManager(temp_client.filepath)
+    plain.delete_transaction(reference_id="1")
+    assert plain.tombstones == {3}
+
+    reopened = ExcelManager(temp_client.filepath, tombstone_deletes=True)
+    assert reopened.compact() == 1
+    assert [t.reference_id for _, t in reopened.iter_rows()] == ["2"]
+    assert reopened.ws.row_dimensions[2].hidden
+
+
+def test_add_transactions_1(temp_client):
+    transactions = [
+        {"amount": "50", "currency": "USD", "conversion_rate": "3.67",
+         "transaction_date": "05/10/2024", "reference_id": "1"},
+        (20.0, "AED", 1.0, "06/10/2024", "2"),
+        (20.0, "AED", 1.0, "06/10/2024", "2"),
+        {"amount": "fifty", "currency": "USD", "conversion_rate": "3.67",
+         "transaction_date": "05/10/2024", "reference_id": "3"},
+        {"amount": "50", "currency": "USD"},
+    ]
+    report = temp_client.add_transactions(iter(transactions))
+
+    assert (report.added, report.rejected, report.duplicates) == (2, 2, ["2"])
+    assert len(report.errors) == 2
+    reloaded = ExcelManager(temp_client.filepath)
+    assert reloaded.find_by_reference("1") == (50.0, "USD", 3.67, "05/10/2024", "1")
+    assert reloaded.ws.max_row == 3
+
+
+def test_add_transactions_2(temp_client):
+    client = ExcelManager(temp_client.filepath, journal=True)
+    report = client.add_transactions((amount, "USD", 1.0, "05/10/2024", str(amount))
+                                     for amount in range(2500))
+    assert report.added == 2500
+    assert client.journal_seq == 2500
+    assert ExcelManager(temp_client.filepath, journal=True).ws.max_row == 2501
+
+
+def test_add_transactions_3(temp_client):
+    # A reference ID typed as a number in Excel
+    temp_client.ws.append([50.0, "USD", 3.67, "05/10/2024", 2431])
+    temp_client.save()
+    client = ExcelManager(temp_client.filepath)
+    report = client.add_transactions([(50.0, "USD", 3.67, "05/10/2024", "2431 ")])
+
+    assert (report.added, report.duplicates) == (0, ["2431"])
+    assert client.ws.max_row == 2
+    assert client.find_row("2431") == client.find_row(2431) == 2
+    assert client.delete_transaction(reference_id="2431")
+    assert client.find_row(2431) is None
+
+
+def test_ledger_reader_1(temp_client):
+    temp_client.add_transactions([
+        (50.0, "USD", 3.67, "2024-10-05T00:00:00.000-07:00", "1"),
+        (20.0, "AED", 1.0, "06/10/2024", "2"),
+        (30.0, "usd", 3.67, "07/11/2024", "3"),
+    ])
+    signature = file_signature(temp_client.filepath)
+    reader = LedgerReader(temp_client.filepath)
+
+    assert [record.reference_id for record in reader.iter_transactions(currency="USD")] == ["1", "3"]
+    assert [record.reference_id for record in reader.iter_transactions(start="2024-10-06", end=date(2024, 10, 31))] == ["2"]
+    assert reader.find_by_reference("2") == Transaction(20.0, "AED", 1.0, "06/10/2024", "2")
+    assert reader.latest().reference_id == "3"
+    # Reading never rewrites the workbook
+    assert file_signature(temp_client.filepath) == signature
+
+
+def test_ledger_reader_2(temp_client):
+    client = ExcelManager(temp_client.filepath, tombstone_deletes=True)
+    client.add_transactions([(1.0, "USD", 1.0, "05/10/2024", reference_id) for reference_id in "123"])
+    client.delete_transaction(reference_id="3")
+
+    reader = LedgerReader(temp_client.filepath, skip_tombstones=True)
+    assert reader.find_by_reference("3") is None
+    assert reader.latest().reference_id == "2"
+
+
+def test_ledger_reader_4(temp_client):
+    # A row hidden by hand in Excel is still a transaction
+    temp_client.add_transactions([(1.0, "USD", 1.0, "05/10/2024", reference_id) for reference_id in "123"])
+    temp_client.ws.row_dimensions[3].hidden = True
+    # Rows after a gap keep their numbers
+    temp_client.ws.cell(row=10, column=5).value = "4"
+    temp_client.ws.cell(row=12, column=5).value = "5"
+    temp_client.ws.row_dimensions[12].hidden = True
+    temp_client.save()
+
+    reader = LedgerReader(temp_client.filepath)
+    assert [t.reference_id for t in reader.iter_transactions()] == \
+        [t.reference_id for _, t in temp_client.iter_rows()] == ["1", "2", "3", "4", "5"]
+    assert reader.find_by_reference("2").reference_id == "2"
+
+
+def test_ledger_reader_5(temp_client):
+    # A reference ID typed as a number in Excel is found as text, as ExcelManager finds it
+    temp_client.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                                transaction_date="05/10/2024", reference_id=2431)
+    reader = LedgerReader(temp_client.filepath)
+    assert temp_client.find_by_reference("2431") is not None
+    assert reader.find_by_reference("2431").amount == 50.0
+    assert reader.find_by_reference(" 2431 ").amount == 50.0
+    assert [t.amount for t in reader._matching(None, None, None, ["2431"])] == [50.0]
+
+
+def test_ledger_reader_3(temp_client, monkeypatch):
+    temp_client.add_transactions([(float(i), "USD" if i % 2 else "AED", 1.0, f"{i:02d}/10/2024", str(i))
+                                  for i in range(1, 21)])
+    reader = LedgerReader(temp_client.filepath)
+    progress = []
+    try:
+        report = reader.generate_receipts("batch-test", reference_ids=[3, "4", "99"], max_workers=1,
+                                          progress=lambda done, total: progress.append((done, total)))
+        assert report.generated == ["batch-test3.png", "batch-test4.png"]
+        assert report.missing == ["99"]
+        assert progress[-1] == (2, 2)
+
+        monkeypatch.setattr(receipt, "PARALLEL_THRESHOLD", 0)
+        report = reader.generate_receipts("batch-test", currency="usd", start="2024-10-05", max_workers=2)
+        assert sorted(report.generated) == sorted(f"batch-test{i}.png" for i in range(5, 21, 2))
+        assert not report.failed
+    finally:
+        for receipt_file in receipt.RECEIPTS_DIR.glob("batch-test*.png"):
+            receipt_file.unlink()
+
+
+def test_export_statement_1(temp_client):
+    temp_client.add_transactions([(float(i), "USD" if i % 2 else "AED", 1.0, f"{i:02d}/10/2024", str(i))
+                                  for i in range(1, 11)])
+    output_path = Path(temp_client.filepath).with_name("statement.pdf")
+    pages = []
+    summary = LedgerReader(temp_client.filepath).export_statement(output_path, "Alice", currency="usd",
+                                                                  progress=pages.append)
+
+    assert summary.receipts == 5 and pages[-1] == 5
+    assert summary.totals == {"USD": 25.0}
+    assert (summary.first_date, summary.last_date) == (date(2024, 10, 1), date(2024, 10, 9))
+    pdf = output_path.read_bytes()
+    assert pdf.startswith(b"%PDF-1.4") and pdf.endswith(b"%%EOF\n")
+    # Summary page first, then one page per receipt
+    assert b"/Type /Pages /Kids [" in pdf and b"/Count 6 >>" in pdf
+    xref = int(pdf.rsplit(b"startxref\n", 1)[1].split()[0])
+    offsets = [int(line[:10]) for line in pdf[xref:].split(b"\n")[3:] if line.endswith(b" n ")]
+    for number, offset in enumerate(offsets, start=1):
+        assert pdf[offset:].startswith(f"{number} 0 obj".encode())
+
+
+def test_differential_save_1(temp_client):
+    temp_client.wb.create_sheet("Notes")["A1"] = "Kept as is"
+    temp_client.save()
+    with ZipFile(temp_client.filepath) as archive:
+        notes_before = archive.read("xl/worksheets/sheet2.xml")
+
+    client = ExcelManager(temp_client.filepath, differential_save=True)
+    client.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                           transaction_date="05/10/2024", reference_id="2431")
+
+    # Only the ledger's part was written again
+    with ZipFile(temp_client.filepath) as archive:
+        assert archive.read("xl/worksheets/sheet2.xml") == notes_before
+    reloaded = ExcelManager(temp_client.filepath)
+    assert reloaded.find_by_reference("2431") == (50.0, "USD", 3.67, "05/10/2024", "2431")
+    assert reloaded.wb["Notes"]["A1"].value == "Kept as is"
+
+
+def test_differential_save_2(temp_client):
+    client = ExcelManager(temp_client.filepath, differential_save=True)
+    client.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                           transaction_date="05/10/2024", reference_id="2431")
+    # New styles need the stylesheet rewritten, so the whole workbook is saved
+    client.ws.cell(row=2, column=1).font = Font(bold=True)
+    client.save()
+
+    reloaded = ExcelManager(temp_client.filepath)
+    assert reloaded.ws.cell(row=2, column=1).font.bold
+
+
+def test_differential_save_3(temp_client):
+    temp_client.wb.create_sheet("Notes")["A1"] = "Kept as is"
+    temp_client.save()
+
+    # Changes outside the ledger make the whole workbook be saved
+    client = ExcelManager(temp_client.filepath, differential_save=True)
+    client.wb["Notes"]["A1"] = "Changed"
+    client.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                           transaction_date="05/10/2024", reference_id="1")
+    client.wb.create_sheet("Summary")
+    client.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                           transaction_date="05/10/2024", reference_id="2")
+
+    reloaded = ExcelManager(temp_client.filepath)
+    assert reloaded.wb.sheetnames == ["Sheet1", "Notes", "Summary"]
+    assert reloaded.wb["Notes"]["A1"].value == "Changed"
+    assert reloaded.find_row("2") == 3
+
+
+def test_transaction_1(temp_client):
+    transaction = Transaction(50.0, "USD", 3.67, "05/10/2024", "2431")
+    temp_client.add(transaction)
+
+    assert temp_client.latest() == transaction
+    assert isinstance(temp_client.find_by_reference("2431"), Transaction)
+    assert [row for row in temp_client.iter_rows()] == [(2, transaction)]
+    assert Transaction.from_row(transaction.to_row() + ["extra"]) == transaction
+    assert Transaction.from_row([1.0]).reference_id is None
+    with pytest.raises(AttributeError):
+        transaction.amount = 10.0
+
+    assert temp_client.delete_transaction(transaction)
+    assert temp_client.latest() is None
+
+
+def test_load_2(temp_client):
+    signature = file_signature(temp_client.filepath)
+    ExcelManager(temp_client.filepath)
+    assert file_signature(temp_client.filepath) == signature
+
+    temp_client.ws.cell(row=1, column=2).value = "Currency Code"
+    temp_client.save()
+    client = ExcelManager(temp_client.filepath)
+    assert client.ws.cell(row=1, column=2).value == "Currency"
+    assert ExcelManager(temp_client.filepath, lazy=True).ws.cell(row=1, column=2).value == "Currency"
+
+
+def test_load_3(temp_client):
+    temp_client.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                                transaction_date="05/10/2024", reference_id="2431")
+    client = ExcelManager(temp_client.filepath, lazy=True)
+    assert not client.loaded
+    assert not client.is_stale()
+
+    assert client.find_row("2431") == 2
+    assert client.loaded
+
+
+def test_cancel_1(temp_client):
+    temp_client.add_transactions([(1.0, "USD", 1.0, "05/10/2024", str(i)) for i in range(5)])
+    reader = LedgerReader(temp_client.filepath)
+    cancelled = threading.Event()
+    cancelled.set()
+    output_path = Path(temp_client.filepath).with_name("statement.pdf")
+
+    assert reader.export_statement(output_path, "Alice", cancelled=cancelled).cancelled
+    assert not output_path.exists()
+    report = reader.generate_receipts("cancel-test", max_workers=1, cancelled=cancelled)
+    assert report.cancelled and not report.generated
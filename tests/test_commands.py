@@ -0,0 +1,77 @@
+import pytest
+from datetime import date
+from core import receipt
+from core.books import ExcelManager
+from core.commands import ADD, DELETE, RECEIPT, FastPath, parse_command
+
+TODAY = date(2024, 10, 21)
+
+
+def test_parse_add_1():
+    command = parse_command("Add a transaction of 30 AED, reference 200, for today at rate of 2.7", today=TODAY)
+    assert command.action == ADD
+    assert command.transaction.amount == 30.0
+    assert command.transaction.currency == "AED"
+    assert command.transaction.conversion_rate == 2.7
+    assert command.transaction.transaction_date.startswith("2024-10-21T00:00:00.000")
+    assert command.transaction.reference_id == "200"
+
+
+def test_parse_add_2():
+    command = parse_command("Please add a transaction reference 231C of $1,250.50 rate 0.212 for 10/21/2024")
+    assert command.transaction[:2] == (1250.5, "USD")
+    assert command.transaction.transaction_date.startswith("2024-10-21")
+    assert command.reference_id == "231c"
+
+
+@pytest.mark.parametrize("prompt", [
+    # Missing rate
+    "Add a transaction of 30 AED, reference 200, for today",
+    # Day and month could be either way round
+    "Add a transaction of 30 AED, reference 200, for 05/10/2024 at rate of 2.7",
+    # Words the grammar does not know
+    "Add a transaction of 30 AED, reference 200, for today at rate of 2.7 unless it is a refund",
+    # Clause given twice
+    "Add a transaction of 30 AED and 40 AED, reference 200, for today at rate of 2.7",
+    "Delete reference 200 and reference 201",
+    "Generate a receipt",
+    "Hello there",
+])
+def test_parse_fallback_1(prompt):
+    assert parse_command(prompt, today=TODAY) is None
+
+
+def test_parse_receipt_1():
+    command = parse_command("Generate a receipt for reference 200 received by Jane Doe")
+    assert (command.action, command.reference_id, command.received_by) == (RECEIPT, "200", "Jane Doe")
+    command = parse_command("Generate a receipt for the latest transaction")
+    assert (command.action, command.reference_id, command.received_by) == (RECEIPT, None, None)
+    assert parse_command("Delete the transaction with reference 200").action == DELETE
+
+
+def test_fast_path_1(temp_path):
+    fast_path = FastPath()
+    replies = fast_path.handle("Add a transaction of 30 AED, reference 200, for today at rate of 2.7", temp_path)
+    assert replies[-1] == "Transaction added successfully."
+    assert fast_path.handle("Hello there", temp_path) is None
+    assert fast_path.handle("Delete the transaction with reference 200", temp_path) == ["Transaction 200 deleted."]
+    assert fast_path.handle("Delete reference 200", temp_path)[0].startswith("No transaction")
+    assert (fast_path.hits, fast_path.misses) == (3, 1)
+    assert fast_path.hit_rate == 0.75
+    fast_path.pool.clear()
+    assert ExcelManager(temp_path).find_row("200") is None
+
+
+def test_fast_path_2(temp_path):
+    fast_path = FastPath()
+    fast_path.handle("Add a transaction of 30 AED, reference 200, for today at rate of 2.7", temp_path)
+    # Receipts need a recipient, which Rasa asks for when the prompt names none
+    assert fast_path.handle("Generate a receipt for reference 200", temp_path) is None
+    try:
+        replies = fast_path.handle("Generate a receipt for reference 200 received by Fast-path-test", temp_path)
+        assert replies[0].startswith("Receipt generated")
+        assert fast_path.handle("Generate a receipt for reference 9 for Jane", temp_path) == \
+            ["No such transaction was found, no receipt generated"]
+    finally:
+        for receipt_file in receipt.RECEIPTS_DIR.glob("Fast-path-test*"):
+            receipt_file.unlink()
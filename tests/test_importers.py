@@ -0,0 +1,36 @@
+from core.books import ExcelManager
+from core.importers import iter_csv, iter_jsonl
+
+
+def test_iter_csv_1(temp_dir, temp_path):
+    source = temp_dir / "export.csv"
+    source.write_text("Amount,Currency,Conversion Rate,Transaction Date,Reference ID\n"
+                      "50.0,USD,3.67,05/10/2024,2431\n"
+                      "20.0,AED,1.0,06/10/2024,2432\n")
+    assert list(iter_csv(source))[1] == {"amount": "20.0", "currency": "AED", "conversion_rate": "1.0",
+                                         "transaction_date": "06/10/2024", "reference_id": "2432"}
+
+    report = ExcelManager(temp_path).add_transactions(iter_csv(source))
+    assert report.added == 2
+
+
+def test_iter_csv_2(temp_dir):
+    source = temp_dir / "export.csv"
+    source.write_text("value;ccy;fx;booked;ref\n50.0;USD;3.67;05/10/2024;2431\n")
+    columns = {"amount": "value", "currency": "ccy", "conversion_rate": "fx",
+               "transaction_date": "booked", "reference_id": "ref"}
+    transaction = next(iter_csv(source, columns=columns, delimiter=";"))
+    assert transaction["reference_id"] == "2431"
+    assert transaction["conversion_rate"] == "3.67"
+
+
+def test_iter_jsonl_1(temp_dir, temp_path):
+    source = temp_dir / "export.jsonl"
+    source.write_text('{"amount": 50.0, "currency": "USD", "conversion_rate": 3.67, '
+                      '"transaction_date": "05/10/2024", "reference_id": "2431"}\n'
+                      '\n'
+                      '[20.0, "AED", 1.0, "06/10/2024", "2432"]\n'
+                      '{not json\n')
+
+    report = ExcelManager(temp_path).add_transactions(iter_jsonl(source))
+    assert (report.added, report.rejected) == (2, 1)
@@ -0,0 +1,54 @@
+import pytest
+from core.books import ExcelManager
+from core.mirror import LedgerMirror
+
+TRANSACTIONS = [
+    (50.0, "USD", 3.67, "05/10/2024", "1"),
+    (20.0, "AED", 1.0, "2024-10-06T00:00:00.000-07:00", "2"),
+    (30.0, "usd", 3.67, "07/11/2024", "3"),
+    (10.0, "EUR", 1.0, "not a date", "4"),
+]
+
+
+@pytest.fixture
+def temp_client(temp_path):
+    client = ExcelManager(temp_path)
+    client.add_transactions(TRANSACTIONS)
+    # A transaction recorded without a conversion rate
+    client.ws.cell(row=5, column=3).value = None
+    return client
+
+
+def test_aggregates_1(temp_client):
+    mirror = LedgerMirror(temp_client)
+
+    assert len(mirror) == 4
+    assert mirror.totals_by_currency() == {"USD": 80.0, "AED": 20.0, "EUR": 10.0}
+    assert mirror.converted_total() == pytest.approx(80.0 * 3.67 + 20.0)
+    assert mirror.converted_total(currency="aed") == pytest.approx(20.0)
+    assert mirror.monthly_totals() == {"2024-10": 70.0, "2024-11": 30.0}
+    assert mirror.top_n(2) == [("1", 50.0, "USD"), ("3", 30.0, "USD")]
+
+
+def test_incremental_1(temp_client):
+    mirror = LedgerMirror(temp_client)
+    temp_client.delete_transaction(reference_id="1")
+    temp_client.add_transaction(amount=5.0, currency="AED", conversion_rate=1.0,
+                                transaction_date="05/12/2024", reference_id="5")
+    temp_client.delete_transaction(reference_id="2")
+
+    assert mirror.totals_by_currency() == {"USD": 30.0, "AED": 5.0, "EUR": 10.0}
+    assert mirror.monthly_totals(currency="AED") == {"2024-12": 5.0}
+    assert mirror.top_n(10)[0] == ("3", 30.0, "USD")
+
+
+def test_incremental_2(temp_client):
+    client = ExcelManager(temp_client.filepath, tombstone_deletes=True)
+    mirror = LedgerMirror(client)
+    client.delete_transaction(reference_id="3")
+    assert mirror.totals_by_currency()["USD"] == 50.0
+
+    client.compact()
+    client.delete_transaction(reference_id="4")
+    assert len(mirror) == 2
+    assert mirror.totals_by_currency() == {"USD": 50.0, "AED": 20.0}
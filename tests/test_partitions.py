@@ -0,0 +1,64 @@
+from core.partitions import PartitionedLedger
+from core.transaction import Transaction
+
+
+def test_add_transaction_1(temp_dir):
+    ledger = PartitionedLedger(temp_dir)
+    assert ledger.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                                  transaction_date="05/10/2024", reference_id="1") == "2024-10"
+    assert ledger.add_transaction(amount=20.0, currency="AED", conversion_rate=1.0,
+                                  transaction_date="2024-11-06T00:00:00.000-07:00", reference_id="2") == "2024-11"
+    assert ledger.add_transaction(amount=20.0, currency="AED", conversion_rate=1.0,
+                                  transaction_date="someday", reference_id="3") == "undated"
+
+    assert ledger.partitions() == ["2024-10", "2024-11", "undated"]
+    assert (temp_dir / "Ledger-2024-11.xlsx").exists()
+    assert ledger.find_by_reference("2") == (20.0, "AED", 1.0, "2024-11-06T00:00:00.000-07:00", "2")
+
+
+def test_add_1(temp_dir):
+    ledger = PartitionedLedger(temp_dir)
+    transaction = Transaction(50.0, "USD", 3.67, "2024-11-06T00:00:00.000-07:00", "1")
+    assert ledger.add(transaction) == "2024-11"
+    assert ledger.find_by_reference("1") == transaction
+    assert PartitionedLedger(temp_dir).find_by_reference("1") == transaction
+
+
+def test_delete_transaction_1(temp_dir):
+    ledger = PartitionedLedger(temp_dir, granularity="year")
+    ledger.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                           transaction_date="05/10/2024", reference_id="1")
+    ledger.add_transaction(amount=20.0, currency="AED", conversion_rate=1.0,
+                           transaction_date="05/10/2025", reference_id="2")
+    assert ledger.delete_transaction("1")
+    assert not ledger.delete_transaction("1")
+
+    # The manifest and index survive a reopen
+    reopened = PartitionedLedger(temp_dir, granularity="month")
+    assert reopened.granularity == "year"
+    assert reopened.partitions() == ["2024", "2025"]
+    assert reopened.find_by_reference("1") is None
+    assert reopened.find_by_reference("2")[0] == 20.0
+
+
+def test_delete_transaction_2(temp_dir):
+    # Reference IDs are matched as ExcelManager matches them
+    ledger = PartitionedLedger(temp_dir)
+    ledger.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                           transaction_date="05/10/2024", reference_id=2431)
+    assert ledger.find_by_reference("2431").amount == 50.0
+    assert ledger.delete_transaction("2431")
+    assert PartitionedLedger(temp_dir).find_by_reference(2431) is None
+
+
+def test_partition_loading_1(temp_dir):
+    ledger = PartitionedLedger(temp_dir)
+    for month in range(1, 4):
+        ledger.add_transaction(amount=1.0, currency="USD", conversion_rate=1.0,
+                               transaction_date=f"2024-0{month}-01", reference_id=str(month))
+
+    reopened = PartitionedLedger(temp_dir)
+    reopened.find_by_reference("2")
+    # Only the partition holding the transaction was loaded
+    assert len(reopened.pool) == 1
+    assert temp_dir / "Ledger-2024-02.xlsx" in reopened.pool
@@ -0,0 +1,61 @@
+import asyncio
+from core.books import ExcelManager
+from core.pool import WorkbookPool, WorkbookWriter
+
+
+def test_acquire_1(temp_paths):
+    pool = WorkbookPool()
+    first = pool.acquire(temp_paths[0])
+    first.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                          transaction_date="05/10/2024", reference_id="2431")
+    assert pool.acquire(temp_paths[0]) is first
+    assert (pool.hits, pool.misses) == (1, 1)
+
+
+def test_acquire_2(temp_paths):
+    pool = WorkbookPool()
+    first = pool.acquire(temp_paths[0])
+    # Someone else writes to the file, the pooled copy must be reloaded
+    ExcelManager(temp_paths[0]).add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                                                transaction_date="05/10/2024", reference_id="2431")
+    second = pool.acquire(temp_paths[0])
+    assert second is not first
+    assert second.find_row("2431") == 2
+
+
+def test_eviction_1(temp_paths):
+    pool = WorkbookPool(max_workbooks=2)
+    for path in temp_paths:
+        pool.acquire(path)
+    assert len(pool) == 2
+    assert temp_paths[0] not in pool
+    assert temp_paths[2] in pool
+
+
+def test_eviction_2(temp_paths):
+    pool = WorkbookPool(max_memory=1)
+    manager = pool.acquire(temp_paths[0])
+    with manager.batch():
+        manager.add_transaction(amount=50.0, currency="USD", conversion_rate=3.67,
+                                transaction_date="05/10/2024", reference_id="2431")
+        pool.acquire(temp_paths[1])
+        # Evicting a workbook saves its deferred writes
+        assert len(pool) == 1
+        assert manager.pending_writes == 0
+
+
+def test_writer_1(temp_paths):
+    writer = WorkbookWriter(WorkbookPool())
+
+    async def add_all():
+        await asyncio.gather(*(
+            writer.submit(path, lambda workbook, reference_id=reference_id: workbook.add_transaction(
+                amount=1.0, currency="USD", conversion_rate=1.0,
+                transaction_date="05/10/2024", reference_id=reference_id))
+            for reference_id in ["1", "2", "3"] for path in temp_paths[:2]))
+        return await writer.submit(temp_paths[0], lambda workbook: workbook.find_row("3"))
+
+    assert asyncio.run(add_all()) == 4
+    writer.shutdown()
+    for path in temp_paths[:2]:
+        assert [ExcelManager(path).ws.cell(row=row, column=5).value for row in (2, 3, 4)] == ["1", "2", "3"]
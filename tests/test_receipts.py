@@ -1,4 +1,7 @@
 import pytest
+import io
+import shutil
+from PIL import Image
 import os
 from pathlib import Path
 from ..core.receipt import generate_receipt
@@ -36,3 +39,117 @@ def test_generate_receipt():
     receipt_path = (Path(__file__).parent.parent / "receipts").resolve() / receipt_name
     assert receipt_path.exists()
     
+
+
+@pytest.fixture
+def signature_path(tmp_path, monkeypatch):
+    """
+    Points the receipt module at a config, signature and receipts folder in tmp_path.
+    """
+    from core import receipt
+    signature_path = tmp_path / "signature.png"
+    shutil.copy(Path(__file__).parent / "test_signature.png", signature_path)
+    config = json.loads(receipt.CONFIG_FILE_PATH.read_text())
+    config['user']['signaturePath'] = str(signature_path)
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(config))
+    monkeypatch.setattr(receipt, "CONFIG_FILE_PATH", config_path)
+    monkeypatch.setattr(receipt, "RECEIPTS_DIR", tmp_path / "receipts")
+    monkeypatch.setattr(receipt, "receipt_cache", receipt.ReceiptCache(tmp_path / "receipts"))
+    receipt.clear_resource_cache()
+    yield signature_path
+    receipt.clear_resource_cache()
+
+
+def test_resource_cache(signature_path):
+    from core import receipt
+    base = receipt.base_image()
+    assert receipt.base_image() is base
+    assert receipt.load_font() is receipt.load_font()
+
+    # Replacing the signature rebuilds the base image
+    Image.new("RGBA", (20, 10), "red").save(signature_path)
+    os.utime(signature_path, ns=(0, 0))
+    rebuilt = receipt.base_image()
+    assert rebuilt is not base
+    assert rebuilt.getpixel(receipt.POSITIONS["signature_area"]) == (255, 0, 0)
+
+
+def test_render_receipt_bytes():
+    from core import receipt
+    before = set(receipt.RECEIPTS_DIR.glob("*")) if receipt.RECEIPTS_DIR.exists() else set()
+    sizes = {}
+    for name, encoder in receipt.ENCODER_PRESETS.items():
+        encoded = receipt.render_receipt_bytes(received_by="Alice", reference_id="2314",
+                                               transaction_date="10/06/2025", amount=50.0,
+                                               currency="USD", encoder=encoder)
+        with Image.open(io.BytesIO(encoded.data)) as img:
+            assert img.format == encoder.format.upper()
+            assert img.size == (585, 451)
+        assert encoded.seconds > 0
+        sizes[name] = encoded.size
+    assert sizes["png-palette"] < sizes["png"]
+    # Nothing is written to the receipts folder
+    after = set(receipt.RECEIPTS_DIR.glob("*")) if receipt.RECEIPTS_DIR.exists() else set()
+    assert after == before
+
+    with pytest.raises(ValueError):
+        receipt.Encoder("gif").encode(Image.new("RGB", (1, 1)))
+
+
+def test_receipt_cache(signature_path):
+    from core import receipt
+    fields = dict(received_by="cache-test", reference_id="1", transaction_date="10/06/2025",
+                  amount=50.0, currency="USD")
+    receipt_name = receipt.generate_receipt(**fields)
+    receipt_path = receipt.RECEIPTS_DIR / receipt_name
+    rendered = receipt_path.read_bytes()
+    mtime_ns = receipt_path.stat().st_mtime_ns
+    assert receipt.generate_receipt(**fields) == receipt_name
+    assert receipt.receipt_cache.hits == 1
+    assert receipt_path.stat().st_mtime_ns == mtime_ns
+
+    # A new signature renders the receipt again
+    Image.new("RGBA", (20, 10), "red").save(signature_path)
+    assert receipt.generate_receipt(**fields) == receipt_name
+    assert receipt.receipt_cache.hits == 1
+    assert receipt_path.read_bytes() != rendered
+
+
+def test_receipt_cache_eviction(tmp_path):
+    from core.receipt import ReceiptCache
+    cache = ReceiptCache(tmp_path, max_entries=2)
+    for name in "abc":
+        (tmp_path / f"{name}.png").write_bytes(name.encode())
+        cache.put(name, f"{name}.png")
+
+    assert cache.get("a") is None
+    assert cache.get("c") == "c.png"
+    # Evicted receipts are forgotten, never deleted
+    assert (tmp_path / "a.png").exists()
+    # The index is shared through the file
+    assert ReceiptCache(tmp_path).lookup(["b", "c"]) == {"b": "b.png", "c": "c.png"}
+
+    (tmp_path / "b.png").write_bytes(b"overwritten by another receipt")
+    assert cache.get("b") is None
+
+
+def test_receipt_cache_recency(tmp_path):
+    from core.receipt import CACHE_INDEX_NAME, ReceiptCache
+    cache = ReceiptCache(tmp_path, max_entries=2)
+    for name in "ab":
+        (tmp_path / f"{name}.png").write_bytes(name.encode())
+        cache.put(name, f"{name}.png")
+    index = (tmp_path / CACHE_INDEX_NAME).read_text()
+
+    # Hits are only remembered in memory
+    assert cache.get("a") == "a.png"
+    assert (tmp_path / CACHE_INDEX_NAME).read_text() == index
+    # ...but still decide what is evicted
+    (tmp_path / "c.png").write_bytes(b"c")
+    cache.put("c", "c.png")
+    assert ReceiptCache(tmp_path).lookup(["a", "b", "c"]) == {"a": "a.png", "c": "c.png"}
+
+    cache.get("a")
+    cache.close()
+    assert list(json.loads((tmp_path / CACHE_INDEX_NAME).read_text())) == ["c", "a"]
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import server
+
+
+class StackHandler(BaseHTTPRequestHandler):
+    # Rasa answers /status a few times before its model is loaded
+    status_calls = 0
+    loaded_after = 3
+
+    def do_GET(self):
+        if self.path == "/status":
+            StackHandler.status_calls += 1
+            loaded = StackHandler.status_calls > StackHandler.loaded_after
+            body = {"model_file": "model.tar.gz" if loaded else None, "num_active_training_jobs": 0}
+        elif self.path == "/health":
+            body = {"status": "ok"}
+        else:
+            self.send_response(503)
+            self.end_headers()
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def base_url():
+    StackHandler.status_calls = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StackHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_wait_until_ready_1(base_url):
+    services = {"Rasa": (f"{base_url}/status", server._model_loaded),
+                "Actions": (f"{base_url}/health", None)}
+    events = []
+    report = asyncio.run(server.wait_until_ready(10, services, on_status=lambda *event: events.append(event)))
+
+    assert report.ready
+    assert set(report.ready_after) == {"Rasa", "Actions"}
+    assert report.ready_after["Actions"] <= report.ready_after["Rasa"]
+    assert events == [("Rasa", server.STARTING), ("Actions", server.READY), ("Rasa", server.READY)]
+    # Short intervals while starting, so the model is seen soon after it loads
+    assert report.seconds < 1
+
+
+def test_wait_until_ready_2(base_url):
+    services = {"Actions": (f"{base_url}/health", None),
+                "Duckling": (f"{base_url}/missing", None),
+                "Closed": ("http://127.0.0.1:9/", None)}
+    report = asyncio.run(server.wait_until_ready(0.5, services))
+
+    assert not report.ready
+    assert list(report.ready_after) == ["Actions"]
+    assert asyncio.run(server.check_servers(services)) == {
+        "Actions": server.READY, "Duckling": server.STARTING, "Closed": server.WAITING}
+
+
+def test_start_server_1(base_url, monkeypatch, tmp_path):
+    monkeypatch.setattr(StackHandler, "loaded_after", 0)
+    monkeypatch.setattr(server, "DOCKER_DIR", tmp_path)
+    monkeypatch.setattr(server, "SERVICES", {"Rasa": (f"{base_url}/status", server._model_loaded),
+                                             "Actions": (f"{base_url}/health", None)})
+    report = server.start_server()
+
+    # A healthy stack is attached to without touching docker
+    assert report.attached and not report.built
+    assert list(report.phases) == ["probe"]
+    assert (tmp_path / ".env").exists()
+
+
+def test_write_env_1(base_url, monkeypatch, tmp_path):
+    monkeypatch.setattr(StackHandler, "loaded_after", 0)
+    monkeypatch.setattr(server, "DOCKER_DIR", tmp_path)
+    monkeypatch.setattr(server, "SERVICES", {"Rasa": (f"{base_url}/status", server._model_loaded)})
+    # A fresh checkout ships relative paths and runs setup before the stack is started
+    env_path = tmp_path / ".env"
+    env_path.write_text((server.ROOT_DIR / "docker" / ".env").read_text())
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"user": {"firstTime": True}}))
+    monkeypatch.setattr(server, "CONFIG_FILE_PATH", config_path)
+    # Saving the setup page clears firstTime before the loading page starts the stack
+    config = json.loads(config_path.read_text())
+    config["user"]["firstTime"] = False
+    config_path.write_text(json.dumps(config))
+
+    server.start_server()
+    assert env_path.read_text().startswith(f"BOT_PATH={(server.ROOT_DIR / 'bot').resolve()}\n")
+
+    # Paths the user set afterwards are kept
+    env_path.write_text("BOT_PATH=/fixed/by/hand\n")
+    server.start_server()
+    assert env_path.read_text() == "BOT_PATH=/fixed/by/hand\n"
+
+
+def test_build_stamp_1(tmp_path):
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("openpyxl==3.1.5\n")
+    stamp = server.build_stamp([requirements, tmp_path / "missing.txt"])
+    assert server.build_stamp([requirements, tmp_path / "missing.txt"]) == stamp
+    requirements.write_text("openpyxl==3.1.6\n")
+    assert server.build_stamp([requirements, tmp_path / "missing.txt"]) != stamp
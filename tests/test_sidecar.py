@@ -0,0 +1,123 @@
+import pytest
+import shutil
+from pathlib import Path
+from openpyxl import load_workbook
+from core.books import ExcelManager
+from core.sidecar import SqliteIndex
+from core.transaction import Transaction
+
+TRANSACTIONS = [
+    (50.0, "USD", 3.67, "05/10/2024", "1"),
+    (20.0, "AED", 1.0, "2024-10-06T00:00:00.000-07:00", "2"),
+    (30.0, "usd", 3.67, "07/11/2024", "3"),
+    (10.0, "EUR", 1.0, "not a date", "4"),
+]
+
+
+@pytest.fixture
+def temp_client(temp_path):
+    client = ExcelManager(temp_path)
+    client.add_transactions(TRANSACTIONS)
+    return client
+
+
+def test_queries_1(temp_client):
+    index = SqliteIndex(temp_client.filepath, temp_client)
+
+    assert len(index) == 4
+    assert index.find_by_reference("2") == Transaction(*TRANSACTIONS[1])
+    assert index.find_by_reference("9") is None
+    assert "3" in index
+    assert [t.reference_id for t in index.query(currency="USD")] == ["1", "3"]
+    assert [t.reference_id for t in index.query(start="2024-10-06", end="2024-10-31")] == ["2"]
+    assert [t.reference_id for t in index.query(currency="usd", start="01/11/2024")] == ["3"]
+    with pytest.raises(ValueError):
+        index.query(start="not a date")
+
+
+def test_sync_1(temp_client):
+    index = SqliteIndex(temp_client.filepath, temp_client)
+    temp_client.delete_transaction(reference_id="1")
+    temp_client.add_transaction(amount=5.0, currency="AED", conversion_rate=1.0,
+                                transaction_date="05/12/2024", reference_id="5")
+
+    assert index.find_row("2") == temp_client.find_row("2")
+    assert index.find_row("5") == temp_client.find_row("5")
+    assert index.find_by_reference("1") is None
+    assert index.is_current()
+
+
+def test_sync_2(temp_client):
+    client = ExcelManager(temp_client.filepath, tombstone_deletes=True, journal=True)
+    index = SqliteIndex(client.filepath, client)
+    client.delete_transaction(reference_id="2")
+    client.add_transaction(amount=5.0, currency="AED", conversion_rate=1.0,
+                           transaction_date="05/12/2024", reference_id="5")
+    assert index.is_current()
+
+    client.compact()
+    client.flush()
+    assert index.find_row("5") == client.find_row("5")
+    assert [t.reference_id for t in index.query(currency="aed")] == ["5"]
+    assert index.is_current()
+
+
+def test_batch_1(temp_client):
+    index = SqliteIndex(temp_client.filepath, temp_client)
+    with temp_client.batch():
+        temp_client.add_transaction(amount=5.0, currency="AED", conversion_rate=1.0,
+                                    transaction_date="05/12/2024", reference_id="5")
+        assert "5" in index
+        # Nothing is committed until the workbook holds the write
+        assert SqliteIndex(temp_client.filepath).find_row("5") is None
+    assert SqliteIndex(temp_client.filepath).find_row("5") == 6
+
+
+def test_stale_1(temp_client):
+    SqliteIndex(temp_client.filepath, temp_client).close()
+    wb = load_workbook(temp_client.filepath)
+    wb.active.append([1.0, "GBP", 1.0, "01/01/2025", "6"])
+    wb.save(temp_client.filepath)
+
+    index = SqliteIndex(temp_client.filepath)
+    assert not index.is_current()
+    index.attach(ExcelManager(temp_client.filepath))
+    assert index.find_by_reference("6") == Transaction(1.0, "GBP", 1.0, "01/01/2025", "6")
+    assert index.is_current()
+
+
+def test_stale_2(temp_client):
+    SqliteIndex(temp_client.filepath, temp_client).close()
+    # A copy keeps its content but not its modification time
+    copy_path = Path(temp_client.filepath).with_name("Copy.xlsx")
+    shutil.copy(temp_client.filepath, copy_path)
+    shutil.copy(f"{temp_client.filepath}.sqlite", f"{copy_path}.sqlite")
+
+    assert SqliteIndex(copy_path).is_current()
+
+
+def test_reopen_1(temp_client):
+    SqliteIndex(temp_client.filepath, temp_client).close()
+
+    index = SqliteIndex(temp_client.filepath, ExcelManager(temp_client.filepath, lazy=True))
+    assert index.rebuilds == 0
+    assert index.find_by_reference("4").transaction_date == "not a date"
+
+
+def test_manager_1(temp_client):
+    temp_client.add_transaction(amount=5.0, currency="AED", conversion_rate=1.0,
+                                transaction_date="05/12/2024", reference_id=2431)
+    ExcelManager(temp_client.filepath, sidecar=True).sidecar.close()
+
+    client = ExcelManager(temp_client.filepath, lazy=True, sidecar=True)
+    # Numeric reference IDs are found as text, without loading the workbook
+    assert client.find_by_reference("2431").amount == 5.0
+    assert "2431" in client.sidecar
+    assert client.find_row("2") == 3
+    assert not client.loaded
+    assert [t.reference_id for t in client.sidecar.query(currency="usd")] == ["1", "3"]
+
+    report = client.add_transactions([(1.0, "USD", 1.0, "01/01/2025", "2431"), (1.0, "USD", 1.0, "01/01/2025", "6")])
+    assert report.duplicates == ["2431"]
+    assert client.sidecar.find_row("6") == client.find_row("6") == 7
+    client.sidecar.close()
@@ -0,0 +1,81 @@
+import json
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.webhook import WebhookClient
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    # Keep-alive needs HTTP/1.1
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def do_POST(self):
+        EchoHandler.connections.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if body["message"] == "fail":
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if body["message"] == "slow":
+            time.sleep(0.2)
+        data = json.dumps([{"recipient_id": body["sender"], "text": f"{body['message']} 1"},
+                           {"recipient_id": body["sender"], "image": "ignored"},
+                           {"recipient_id": body["sender"], "text": f"{body['message']} 2"}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    EchoHandler.connections = set()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/webhooks/rest/webhook"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_order_1(url):
+    events = []
+    done = threading.Event()
+    client = WebhookClient(url, on_message=lambda prompt_id, text: events.append((prompt_id, text)),
+                           on_error=lambda prompt_id, e: events.append((prompt_id, "error")),
+                           on_done=lambda prompt_id: prompt_id == 4 and done.set())
+    # Submitting never waits for the bot
+    started = time.perf_counter()
+    ids = [client.submit(prompt) for prompt in ("slow", "second", "fail", "last")]
+    assert time.perf_counter() - started < 0.2
+    assert done.wait(5)
+    client.close()
+
+    assert ids == [1, 2, 3, 4]
+    assert events == [(1, "slow 1"), (1, "slow 2"), (2, "second 1"), (2, "second 2"),
+                      (3, "error"), (4, "last 1"), (4, "last 2")]
+    assert client.pending() == 0
+    # Every prompt went over the same connection
+    assert len(EchoHandler.connections) == 1
+
+
+def test_local_1(url):
+    events = []
+    done = threading.Event()
+    client = WebhookClient(url, on_message=lambda prompt_id, text: events.append((prompt_id, text)),
+                           on_done=lambda prompt_id: prompt_id == 3 and done.set())
+    client.submit("slow")
+    # Answered locally, but only after the prompt before it
+    client.submit("local", handle_locally=lambda: ["handled locally"])
+    client.submit("remote", handle_locally=lambda: None)
+    assert done.wait(5)
+    client.close()
+
+    assert events == [(1, "slow 1"), (1, "slow 2"), (2, "handled locally"), (3, "remote 1"), (3, "remote 2")]
@@ -1,53 +1,281 @@
+import hashlib
 import subprocess
-import requests
 import time
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable, Dict, Optional, Set
 import json
 import aiohttp
 import asyncio
 
+ROOT_DIR = Path(__file__).parent.parent
+DOCKER_DIR = (ROOT_DIR / "docker").resolve()
+CONFIG_FILE_PATH = ROOT_DIR / "config" / "config.json"
+COMPOSE_SERVICES = ("rasa", "actions", "duckling")
+# Files the images are built from; they are rebuilt only when one of these changes
+BUILD_INPUTS = (
+    ROOT_DIR / "bot" / "actions" / "requirements_core.txt",
+    ROOT_DIR / "bot" / "actions" / "requirements_action.txt",
+    DOCKER_DIR / "DockerfileCore",
+    DOCKER_DIR / "DockerfileActions",
+    DOCKER_DIR / "docker-compose.yml",
+)
+BUILD_STAMP_NAME = ".build-stamp"
+# Written next to .env once Calcite has set its paths; from then on the user's values are kept
+ENV_STAMP_NAME = ".env-written"
 
-def start_server() -> None:
+CORE_SERVER_STATUS_URL = "http://localhost:5005/status"
+ACTIONS_SERVER_HEALTH_URL = "http://localhost:5055/health"
+DUCKLING_URL = "http://localhost:8000/"
+# Seconds between probes, growing while nothing changes and reset when a service moves on
+PROBE_INTERVAL = 0.1
+MAX_PROBE_INTERVAL = 1.0
+PROBE_BACKOFF = 1.5
+# Seconds a single probe may take
+PROBE_TIMEOUT = 2
+
+# Service states, in the order a starting service goes through them
+WAITING, STARTING, READY = "waiting", "starting", "ready"
+
+
+def _model_loaded(status: dict) -> bool:
+    # Rasa answers /status while it is still loading its model, without a model file
+    return bool(status.get("model_file"))
+
+
+# Service name -> (URL, check of its JSON answer or None if answering is enough)
+SERVICES: Dict[str, tuple] = {
+    "Rasa": (CORE_SERVER_STATUS_URL, _model_loaded),
+    "Actions": (ACTIONS_SERVER_HEALTH_URL, None),
+    "Duckling": (DUCKLING_URL, None),
+}
+
+
+@dataclass
+class StartupReport:
     """
-    Starts the docker container
-    If it is the user's first time running the server,
-    the docker image will be built first.
+    How the stack was brought up.
+    Attributes:
+        attached (bool): Whether a stack that was already running was reused
+        built (bool): Whether the images were rebuilt
+        phases (dict): Seconds taken by each startup phase, in order
+    """
+    attached: bool
+    built: bool = False
+    phases: Dict[str, float] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        phases = ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in self.phases.items())
+        mode = "attached to running stack" if self.attached else "started stack"
+        return f"Docker {mode} ({phases})"
+
+
+def _write_env() -> None:
+    """
+    Writes the absolute volume paths docker compose mounts, once per checkout.
+    The shipped .env holds relative paths, so it is replaced the first time the
+    stack is started; afterwards the file is left as it is, so paths the user
+    set by hand are kept. Deleting docker/.env-written writes it again.
     :return: None
     """
-    config_file_path = Path(__file__).parent.parent / "config" / "config.json"
-    with open(config_file_path, "r") as f:
-        data = json.load(f)
-        first_time = data["user"]["firstTime"]
+    env_path = DOCKER_DIR / ".env"
+    stamp_path = DOCKER_DIR / ENV_STAMP_NAME
+    if env_path.exists() and stamp_path.exists():
+        return
+    env_content = (
+        f"BOT_PATH={(ROOT_DIR / 'bot').resolve()}\n"
+        f"ACTIONS_PATH={(ROOT_DIR / 'actions').resolve()}\n"
+        f"CORE_PATH={(ROOT_DIR / 'core').resolve()}\n"
+        f"SHEET_PATH={(ROOT_DIR / 'sheet_data').resolve()}\n"
+    )
+    env_path.write_text(env_content)
+    stamp_path.write_text("")
+
+
+def build_stamp(paths=BUILD_INPUTS) -> str:
+    """
+    Hashes the files the images are built from.
+    :param paths: Files to hash, missing ones count as empty
+    :return: Hex digest, changing whenever a requirements file or Dockerfile does
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).name.encode())
+        if Path(path).exists():
+            digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
 
-    docker_dir = (Path(__file__).parent.parent / "docker").resolve()
-    if first_time:
-        # if first time build the docker image
-        bot_dir = (Path(__file__).parent.parent / "bot").resolve()
-        actions_dir = (Path(__file__).parent.parent / "actions").resolve()
-        sheet_dir = (Path(__file__).parent.parent / "sheet_data").resolve()
-        core_dir = (Path(__file__).parent.parent / "core").resolve()
+def running_services() -> Set[str]:
+    """
+    Lists the compose services with a running container.
+    :return: Service names, empty if docker is unavailable
+    """
+    try:
+        result = subprocess.run(["docker", "compose", "ps", "--status", "running", "--services"],
+                                cwd=DOCKER_DIR, capture_output=True, text=True)
+    except OSError:
+        return set()
+    if result.returncode != 0:
+        return set()
+    return set(result.stdout.split())
 
-        env_content = (
-            f"BOT_PATH={bot_dir}\n"
-            f"ACTIONS_PATH={actions_dir}\n"
-            f"CORE_PATH={core_dir}\n"
-            f"SHEET_PATH={sheet_dir}\n"
-        )
 
-        with open(docker_dir / ".env", "w") as f:
-            f.write(env_content)
+def keep_alive() -> bool:
+    """
+    Whether the stack keeps running after the app closes, set with
+    "server": {"keepAlive": false} in config.json. Defaults to True.
+    """
+    with open(CONFIG_FILE_PATH, "r") as f:
+        return json.load(f).get("server", {}).get("keepAlive", True)
+
+
+def start_server() -> StartupReport:
+    """
+    Brings the docker stack up, doing only what is needed:
+    a stack whose services already answer, or whose containers are all
+    running, is attached to as it is. Otherwise the images are rebuilt,
+    with docker's layer cache, only when the files they are built from
+    changed since the last build, and the stack is started detached so it
+    can outlive the app.
+    :return: StartupReport with the time taken by each phase
+    """
+    report = StartupReport(attached=True)
 
-        subprocess.run(["docker", "compose", "build", "--no-cache"],
-                         cwd=docker_dir.resolve())
+    def phase(name: str, started: float) -> None:
+        report.phases[name] = time.perf_counter() - started
+        print(f"Startup phase {name} took {report.phases[name]:.1f}s")
 
-    subprocess.Popen(["docker", "compose", "up"], cwd=docker_dir.resolve())
+    started = time.perf_counter()
+    _write_env()
+    healthy = all(state == READY for state in asyncio.run(check_servers()).values())
+    phase("probe", started)
+    if healthy:
+        return report
 
+    started = time.perf_counter()
+    running = running_services()
+    phase("ps", started)
+    if running.issuperset(COMPOSE_SERVICES):
+        # Still starting; the readiness probe waits for it
+        return report
 
-def check_servers_sync():
-    """Synchronously checks the health of both servers."""
+    report.attached = False
+    stamp_path = DOCKER_DIR / BUILD_STAMP_NAME
+    stamp = build_stamp()
+    if not stamp_path.exists() or stamp_path.read_text() != stamp:
+        started = time.perf_counter()
+        if subprocess.run(["docker", "compose", "build"], cwd=DOCKER_DIR).returncode == 0:
+            stamp_path.write_text(stamp)
+        report.built = True
+        phase("build", started)
+
+    started = time.perf_counter()
+    subprocess.run(["docker", "compose", "up", "-d"], cwd=DOCKER_DIR)
+    phase("up", started)
+    return report
+
+
+def stop_server() -> None:
+    """
+    Stops the stack's containers without waiting for them. They are kept,
+    so the next start is a restart rather than a fresh create.
+    :return: None
+    """
+    subprocess.Popen(["docker", "compose", "stop"], cwd=DOCKER_DIR)
+
+
+@dataclass
+class ReadinessReport:
+    """
+    Outcome of waiting for the stack.
+    Attributes:
+        ready (bool): Whether every service was ready before the timeout
+        seconds (float): Time spent waiting
+        ready_after (dict): Seconds until each ready service was ready
+    """
+    ready: bool
+    seconds: float
+    ready_after: Dict[str, float] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        services = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.ready_after.items())
+        outcome = "ready" if self.ready else "not ready"
+        return f"Stack {outcome} after {self.seconds:.1f}s ({services or 'no service ready'})"
+
+
+async def probe(session: aiohttp.ClientSession, url: str,
+                check: Optional[Callable[[dict], bool]] = None) -> str:
+    """
+    Probes one service.
+    :param session: Session the probe is sent with
+    :param url: Health endpoint of the service
+    :param check: Called with the endpoint's JSON answer, True if the service is usable
+    :return: WAITING if nothing answered, STARTING if the service answered but is not usable yet, else READY
+    """
     try:
-        core_res = requests.get("http://localhost:5005/status", timeout=5)
-        actions_res = requests.get("http://localhost:5055/health", timeout=5)
-        return core_res.status_code == 200 and actions_res.status_code == 200
-    except requests.exceptions.RequestException:
-        return False
+        async with session.get(url) as response:
+            if response.status != 200:
+                return STARTING
+            if check is not None and not check(await response.json(content_type=None)):
+                return STARTING
+            return READY
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        return WAITING
+
+
+async def check_servers(services: Optional[Dict[str, tuple]] = None) -> Dict[str, str]:
+    """
+    Probes every service at once.
+    :param services: Services to probe, defaults to SERVICES
+    :return: State of each service
+    """
+    services = services or SERVICES
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT)) as session:
+        states = await asyncio.gather(*(probe(session, *services[name]) for name in services))
+    return dict(zip(services, states))
+
+
+async def wait_until_ready(timeout: float = 300, services: Optional[Dict[str, tuple]] = None,
+                           on_status: Optional[Callable[[str, str], None]] = None) -> ReadinessReport:
+    """
+    Probes every service at once, over and over, until all are ready.
+    Probes start 0.1s apart and back off to 1s while nothing changes, so the
+    stack is reported ready at most a second after it is, and usually sooner.
+    :param timeout: Seconds to wait before giving up
+    :param services: Services to wait for, defaults to SERVICES
+    :param on_status: Called with (service name, state) whenever a service changes state
+    :return: ReadinessReport
+    """
+    services = services or SERVICES
+    states: Dict[str, Optional[str]] = dict.fromkeys(services)
+    ready_after: Dict[str, float] = {}
+    started = time.perf_counter()
+    interval = PROBE_INTERVAL
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT)) as session:
+        while True:
+            pending = [name for name in services if name not in ready_after]
+            results = await asyncio.gather(*(probe(session, *services[name]) for name in pending))
+            elapsed = time.perf_counter() - started
+            changed = False
+            for name, state in zip(pending, results):
+                if state == states[name]:
+                    continue
+                changed = True
+                states[name] = state
+                print(f"{name} {state} after {elapsed:.1f}s")
+                if state == READY:
+                    ready_after[name] = elapsed
+                if on_status:
+                    on_status(name, state)
+            if len(ready_after) == len(services):
+                return ReadinessReport(True, elapsed, ready_after)
+            if elapsed >= timeout:
+                return ReadinessReport(False, elapsed, ready_after)
+            interval = PROBE_INTERVAL if changed else min(interval * PROBE_BACKOFF, MAX_PROBE_INTERVAL)
+            await asyncio.sleep(min(interval, timeout - elapsed))
+
+
+def check_servers_sync() -> bool:
+    """Synchronously checks whether every service is ready."""
+    return all(state == READY for state in asyncio.run(check_servers()).values())
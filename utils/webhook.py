@@ -0,0 +1,112 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+# Seconds to wait for a connection, then for the bot's answer
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+
+
+class WebhookClient:
+    """
+    Sends prompts to the Rasa REST webhook off the caller's thread.
+    Prompts are sent one after another over a single kept-alive connection,
+    in the order they were submitted, so any number can be queued while
+    earlier ones are still being answered. Rasa handles one message per
+    conversation at a time anyway; sending in order keeps the conversation,
+    e.g. a confirmation answering a form, in the order the user typed it.
+    Each message of an answer is passed to on_message as soon as the answer
+    is read. A prompt may come with a local handler, run in its turn on the
+    worker thread, that answers it without the webhook. Callbacks run on the
+    client's worker thread.
+    Attributes:
+        url (str): Webhook URL
+        sender (str): Conversation ID sent with every prompt
+    Methods:
+        submit(prompt, handle_locally): Queues a prompt and returns its ID.
+        pending(): Number of prompts not answered yet.
+        close(): Drops queued prompts and closes the connection.
+    """
+
+    def __init__(self, url: str, sender: str = "user1",
+                 on_message: Optional[Callable[[int, str], None]] = None,
+                 on_error: Optional[Callable[[int, Exception], None]] = None,
+                 on_done: Optional[Callable[[int], None]] = None) -> None:
+        """
+        Initializes the client. No connection is made until the first prompt.
+        :param url: Webhook URL
+        :param sender: Conversation ID sent with every prompt
+        :param on_message: Called with (prompt ID, text) for every message of an answer
+        :param on_error: Called with (prompt ID, exception) when a prompt could not be answered
+        :param on_done: Called with the prompt ID once a prompt is answered or failed
+        """
+        self.url = url
+        self.sender = sender
+        self.on_message = on_message
+        self.on_error = on_error
+        self.on_done = on_done
+        self.session = requests.Session()
+        self.session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webhook")
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def submit(self, prompt: str, handle_locally: Optional[Callable[[], Optional[List[str]]]] = None) -> int:
+        """
+        Queues a prompt behind those submitted before it.
+        :param prompt: Message to send, including any EXCEL_FILE_PATH suffix
+        :param handle_locally: Called first; the messages it returns answer the prompt
+        instead of the webhook, which is only used if it returns None
+        :return: Prompt ID passed to the callbacks
+        """
+        prompt_id = next(self._ids)
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._send, prompt_id, prompt, handle_locally)
+        return prompt_id
+
+    def _send(self, prompt_id: int, prompt: str,
+              handle_locally: Optional[Callable[[], Optional[List[str]]]] = None) -> List[str]:
+        texts = []
+        try:
+            replies = handle_locally() if handle_locally else None
+            if replies is not None:
+                for text in replies:
+                    texts.append(text)
+                    if self.on_message:
+                        self.on_message(prompt_id, text)
+                return texts
+            response = self.session.post(self.url, json={"sender": self.sender, "message": prompt},
+                                         timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            response.raise_for_status()
+            for message in response.json():
+                if "text" in message:
+                    texts.append(message["text"])
+                    if self.on_message:
+                        self.on_message(prompt_id, message["text"])
+        except Exception as e:
+            if self.on_error:
+                self.on_error(prompt_id, e)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            if self.on_done:
+                self.on_done(prompt_id)
+        return texts
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Drops prompts not sent yet and closes the connection.
+        :param wait: Wait for the prompt being answered first
+        :return: None
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self.session.close()